@@ -0,0 +1,116 @@
+import array
+import sys
+
+"""
+Array valued state variables: vectors and matrices, e.g. spatial profiles of distributed parameter models.
+Table class declares them next to COLUMNS (array names are listed in COLUMNS as well):
+    ARRAYS = {"Tprofile": ("d", [50]), "Fgrid": ("f", [10, 20])}
+dtype is typecode of array module with fixed item size (TYPECODES), shape gives number
+of elements stored in row-major order. Server keeps values as flat array.array,
+sessions with binary codec transfer them as raw little endian buffers (see SchemaCodec),
+JSON messages carry them as flat lists. Clients may send array.array, list
+or any contiguous object supporting buffer protocol (e.g. numpy array of the same dtype).
+"""
+
+TYPECODES = 'bBhHiIqQfd' # 'l' and 'L' have different size on different platforms
+_SWAP = sys.byteorder != 'little'
+
+
+class ArrayVariable(object):
+    """dtype and shape of array variable"""
+
+    def __init__(self, typecode, shape):
+        """
+        :param typecode: array module typecode from TYPECODES
+        :param shape: list of dimensions
+        """
+        if typecode not in TYPECODES:
+            raise Exception('Unsupported array typecode: %s, available: %s' % (typecode, TYPECODES))
+        self.typecode = typecode
+        self.shape = tuple(shape)
+        self.size = 1
+        for n in self.shape:
+            self.size *= n
+        self.itemsize = array.array(typecode).itemsize
+        self.nbytes = self.size * self.itemsize
+
+    def declaration(self):
+        """:return: [typecode, shape] sent in session handshake"""
+        return [self.typecode, list(self.shape)]
+
+    def array(self, value):
+        """
+        :param value: array.array, list (nested lists of matrix are flattened) or object with buffer protocol
+        :return: value as flat array.array, buffers are copied as raw bytes without converting elements
+        """
+        if isinstance(value, array.array) and value.typecode == self.typecode:
+            result = value
+        elif isinstance(value, (list, tuple)):
+            while value and isinstance(value[0], (list, tuple)):
+                value = [v for row in value for v in row]
+            result = array.array(self.typecode, value)
+        else:
+            view = memoryview(value)
+            if view.itemsize not in (1, self.itemsize): # raw bytes or items of the same size
+                raise Exception('Array of %d byte items sent instead of %s' % (view.itemsize, self.typecode))
+            result = array.array(self.typecode)
+            result.frombytes(view.cast('B'))
+        if len(result) != self.size:
+            raise Exception('Array has %d elements instead of %d %s' % (len(result), self.size, self.shape))
+        return result
+
+    def encode(self, value):
+        """:return: raw little endian bytes of value"""
+        value = self.array(value)
+        if _SWAP:
+            value = array.array(self.typecode, value)
+            value.byteswap()
+        return memoryview(value).cast('B')
+
+    def decode(self, data):
+        """:return: array.array of raw little endian bytes"""
+        if len(data) != self.nbytes:
+            raise Exception('Array has %d bytes instead of %d' % (len(data), self.nbytes))
+        value = array.array(self.typecode)
+        value.frombytes(data)
+        if _SWAP:
+            value.byteswap()
+        return value
+
+
+def array_variables(declarations):
+    """
+    :param declarations: {name: (typecode, shape)} like ARRAYS of table or arrays of handshake response
+    :return: {name: ArrayVariable}
+    """
+    return {k: ArrayVariable(*spec) for k, spec in (declarations or {}).items()}
+
+
+def table_arrays(table):
+    """Array variables declared by table class, tables without ARRAYS have none"""
+    return array_variables(getattr(table, 'ARRAYS', None))
+
+
+def to_arrays(data, arrays):
+    """
+    Converts arrays of JSON message (flat lists) to array.array of declared typecode, data is changed in place
+    :param arrays: {name: ArrayVariable}
+    :return: data
+    """
+    if not arrays:
+        return data
+    for k, v in data.items():
+        if v is not None and k in arrays:
+            data[k] = arrays[k].array(v)
+    return data
+
+
+def to_json(value):
+    """default of json.dumps: arrays and other buffers are written as flat lists"""
+    try:
+        view = memoryview(value)
+    except TypeError:
+        raise TypeError('Object of type %s is not JSON serializable' % type(value).__name__)
+    if view.ndim > 1:
+        view = view.cast('B').cast(view.format)
+    return view.tolist()
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+
+from protocol import ConfirmationProtocolManager
+from session import ClientSession
+from transport import parse_address
+
+logger = logging.getLogger(__name__)
+
+"""
+Client api for asyncio programs. One process hosting several subsystems
+exchanges their data concurrently instead of one after another:
+exchange of one subsystem waits in the server barrier while the others send their data.
+
+    async def main():
+        group = ClientGroup(read_endpoint())
+        await group.open({"boiler": (["b1"], ["t1"]), "turbine": (["t1"], ["b1"])})
+        responses = await group.exchange({"boiler": {"b1": 1.0}, "turbine": {"t1": 2.0}})
+        await group.close()
+"""
+
+
+class AsyncClient(object):
+    """Asyncio counterpart of client.Client, one persistent connection to the server"""
+
+    def __init__(self, ip, port=None, protocol=ConfirmationProtocolManager(), buffer_size=None):
+        """
+        :param ip: server ip or server address: tcp:host:port, unix:path (see read_endpoint)
+        :param port: server tcp/ip port, may be omitted when it is part of address
+        :param protocol: object that sends and receives python data structures
+        :param buffer_size: socket buffers in bytes, None - system defaults
+        """
+        self.ip = ip
+        self.port = port
+        self.protocol = protocol
+        self.buffer_size = buffer_size
+        self.transport = parse_address(ip, port, buffer_size)
+        self.reader = None
+        self.writer = None
+        self.session = ClientSession() # plain JSON messages until session is opened
+
+    async def connect(self):
+        """Connects to server, exchanges without session connect on first use"""
+        if self.writer is not None:
+            return
+        # transports create blocking sockets, connecting would block the event loop
+        sock = await asyncio.get_running_loop().run_in_executor(None, self.transport.connect)
+        self.reader, self.writer = await asyncio.open_connection(sock=sock, limit=2 ** 24)
+
+    async def _exchange_message(self, message):
+        """Sends message prepared by session, :return: received response"""
+        await self.connect()
+        await self.protocol.send_async(self.reader, self.writer, message)
+        return await self.protocol.receive_async(self.reader, self.writer)
+
+    async def open_session(self, name=None, data=None, request=None, codec=None, simulation=None, delta=False,
+                           compression=None, zdict=False):
+        """
+        Starts session on new connection, parameters are described in Client.open_session
+        :return: server response to handshake
+        """
+        await self.close()
+        session = ClientSession(name, data, request, codec, simulation, delta, compression, zdict)
+        try:
+            response = await self._exchange_message(session.handshake())
+            redirect = session.start(response)
+        except:
+            await self.close()
+            raise
+        if redirect is not None:
+            await self.close()
+            self.ip, self.port = redirect, None
+            self.transport = parse_address(self.ip, None, self.buffer_size)
+            return await self.open_session(name, data, request, codec, simulation, delta, compression, zdict)
+        self.session = session
+        return response
+
+    async def exchange(self, data, request=None):
+        """
+        Sends data of one step and waits until the server completes it
+        :param data: dictionary of sent variables
+        :param request: list of requested variables' names, may be omitted if declared in session
+        :return: requested data
+        """
+        session = self.session
+        return session.step_response(await self._exchange_message(session.step(data, request)), request)
+
+    async def exchange_block(self, block, request=None):
+        """
+        Exchanges several consecutive steps in one round trip
+        :param block: list of data dictionaries, one for every step
+        :param request: list of requested variables' names, may be omitted if declared in session
+        :return: list of requested data of every step
+        """
+        session = self.session
+        return session.block_response(await self._exchange_message(session.block(block, request)), request)
+
+    async def stats(self):
+        """:return: server metrics (see Client.stats)"""
+        return self.session.unpack(await self._exchange_message(self.session.stats()))
+
+    async def history(self, variables=None, first=None, last=None):
+        """:return: values of recent steps kept by server (see Client.history)"""
+        session = self.session
+        return session.history_response(await self._exchange_message(session.history(variables, first, last)))
+
+    async def close(self):
+        """Ends session and closes connection"""
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = None
+        self.writer = None
+        self.session = ClientSession()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class ClientGroup(object):
+    """
+    Several logical clients (subsystems) of one process sharing pool of connections.
+    Logical clients are assigned to connections round robin, every connection runs one session
+    sending data of all its clients, so a step of the whole group takes one message per connection
+    and all connections wait in the server barrier at the same time.
+    With connections=1 the group finishes every step in a single round trip.
+    """
+
+    def __init__(self, ip, port=None, protocol=ConfirmationProtocolManager(), connections=1, buffer_size=None):
+        """
+        :param connections: size of connection pool, the group never opens more connections than clients
+        other parameters are described in AsyncClient
+        """
+        self.ip = ip
+        self.port = port
+        self.protocol = protocol
+        self.connections = connections
+        self.buffer_size = buffer_size
+        self.clients = [] # [AsyncClient, {logical client: (data, request)}]
+
+    async def open(self, clients, simulation=None, delta=False, compression=None, zdict=False):
+        """
+        Opens sessions of pooled connections
+        :param clients: dictionary {name: (sent variables, requested variables)} of logical clients
+        :param simulation: name of simulation to join
+        :param delta: delta sessions, see Client.open_session
+        :param compression: compression threshold of sessions, see Client.open_session
+        :param zdict: compression with preset dictionary
+        :return: list of handshake responses of connections
+        """
+        await self.close()
+        n = max(1, min(self.connections, len(clients)))
+        assigned = [{} for _ in range(n)]
+        for i, name in enumerate(sorted(clients)):
+            data, request = clients[name]
+            assigned[i % n][name] = (list(data or []), list(request or []))
+        self.clients = [[AsyncClient(self.ip, self.port, self.protocol, self.buffer_size), members]
+                        for members in assigned]
+        try:
+            return await asyncio.gather(*[
+                client.open_session('+'.join(sorted(members)),
+                                    sorted({k for data, _ in members.values() for k in data}),
+                                    sorted({k for _, request in members.values() for k in request}),
+                                    simulation=simulation, delta=delta, compression=compression, zdict=zdict)
+                for client, members in self.clients])
+        except:
+            await self.close()
+            raise
+
+    async def _exchange(self, client, members, data):
+        merged = {}
+        for name in members:
+            merged.update(data.get(name) or {})
+        received_data = await client.exchange(merged)
+        return {name: dict({k: received_data.get(k) for k in request}, time=received_data.get("time"))
+                for name, (_, request) in members.items()}
+
+    async def exchange(self, data):
+        """
+        Exchanges one step of all logical clients concurrently
+        :param data: dictionary {name: data of logical client}
+        :return: dictionary {name: requested data of logical client}
+        """
+        responses = {}
+        for response in await asyncio.gather(*[self._exchange(client, members, data)
+                                               for client, members in self.clients]):
+            responses.update(response)
+        return responses
+
+    async def close(self):
+        await asyncio.gather(*[client.close() for client, _ in self.clients])
+        self.clients = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
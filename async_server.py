@@ -0,0 +1,433 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from arrays import table_arrays
+from history import StateHistory
+from log_config import sampled
+from metrics import Metrics, start_dumping
+from protocol import ConfirmationProtocolManager
+from session import ServerSession
+from transport import parse_address
+
+logger = logging.getLogger(__name__)
+
+
+class Step(object):
+    """Variables gathered in one time step"""
+
+    def __init__(self, names, time, links=0):
+        """:param links: number of federation links which have to arrive besides variables"""
+        self.values = dict.fromkeys(names)
+        self.missing = len(self.values) + links
+        self.time = time
+        self.started = None
+        self.complete = asyncio.Event()
+        self.projections = {}
+
+    def update(self, data):
+        """Puts client data into step, unknown variables and None values are ignored"""
+        if self.started is None:
+            self.started = time.perf_counter()
+        values = self.values
+        for k, v in data.items():
+            if v is not None and k in values:
+                if values[k] is None:
+                    self.missing -= 1
+                values[k] = v
+
+    def arrive(self):
+        """Link to other node has passed the step"""
+        if self.started is None:
+            self.started = time.perf_counter()
+        self.missing -= 1
+
+    def row(self, time_name):
+        row = dict(self.values)
+        row[time_name] = self.time
+        return row
+
+    def projection(self, request, time_name):
+        """
+        Requested variables of complete step, computed once for every distinct request
+        and shared by all clients asking for it (must not be modified)
+        :param request: frozenset of names
+        """
+        projection = self.projections.get(request)
+        if projection is None:
+            values = self.values
+            projection = {k: values[k] for k in request if k in values}
+            projection[time_name] = self.time
+            self.projections[request] = projection
+        return projection
+
+
+class Simulation(object):
+    """
+    State, step barrier and database sink of one simulation.
+    Clients sending blocks of consecutive steps fill several open steps at once,
+    steps are finished in order and all rows completed together go to database as one batch.
+    Requests declared in sessions are subscriptions: when step is finished, every distinct
+    subscribed projection is computed once and waiting clients only send it.
+    
+    Database operations run in its own single thread executor,
+    so slow commit does not stop the event loop and rows stay ordered.
+    """
+    TIME = "time"
+
+    def __init__(self, name, names, db_updater, db_update_time=1, metrics=None, history=1000, links=0, arrays=()):
+        """
+        :param name: simulation name, clients choose it in session handshake
+        :param names: state variables
+        :param db_updater: DatabaseUpdater (production mode), DatabaseUpdaterSimulator(sim mode)
+        :param db_update_time: seconds between database commits
+        :param metrics: Metrics with phases of AsyncServer.PHASES, shared by simulations of one server
+        :param history: number of recent steps kept for history requests, 0 - none
+        :param links: number of links to other nodes taking part in every step (see FederatedServer)
+        :param arrays: names of array variables, history keeps only scalar ones
+        """
+        self.name = name
+        self.names = names
+        self.links = links
+        self.db_updater = db_updater
+        self.db_update_time = db_update_time
+        self.steps = deque([Step(names, 1, links)]) # open steps, the first one is current
+        self.clients = 0
+        self.subscriptions = {} # requested variables -> number of subscribed sessions
+        self.forwarders = [] # [variables, queue, time of the next forwarded step]
+        self.history = StateHistory([k for k in names if k not in arrays], history, None) if history else None
+        self.metrics = metrics if metrics is not None else Metrics(AsyncServer.PHASES, AsyncServer.COUNTERS, threading)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._committer = asyncio.ensure_future(self.commit_periodically())
+
+    def subscribe(self, request):
+        """:param request: frozenset of variables requested by session in every step"""
+        self.subscriptions[request] = self.subscriptions.get(request, 0) + 1
+
+    def unsubscribe(self, request):
+        n = self.subscriptions.pop(request, 0) - 1
+        if n > 0:
+            self.subscriptions[request] = n
+
+    def forward(self, names):
+        """
+        Values of given variables in every step are put into returned queue as (time, values)
+        as soon as clients have sent them, before the step is complete
+        (see FederatedServer, which forwards them to other nodes)
+        """
+        forwarder = [list(names), asyncio.Queue(), self.step.time]
+        self.forwarders.append(forwarder)
+        self._forward()
+        return forwarder[1]
+
+    def _forward(self):
+        steps = self.steps
+        for forwarder in self.forwarders:
+            names, queue, t = forwarder
+            i = t - steps[0].time
+            while 0 <= i < len(steps):
+                values = steps[i].values
+                if any(values[k] is None for k in names):
+                    break
+                queue.put_nowait((t, {k: values[k] for k in names}))
+                t += 1
+                i += 1
+            forwarder[2] = t
+
+    def put(self, time, data):
+        """Puts data of link into step of given time without waiting for it (data forwarded by other node)"""
+        step = self._open_steps(time - self.step.time + 1)[-1]
+        step.update(data)
+        step.arrive()
+        self._finish_steps()
+
+    @property
+    def step(self):
+        """Current step"""
+        return self.steps[0]
+
+    def _open_steps(self, n):
+        """:return: current step and n - 1 following ones"""
+        steps = self.steps
+        while len(steps) < n:
+            steps.append(Step(self.names, steps[-1].time + 1, self.links))
+        return [steps[i] for i in range(n)]
+
+    def _finish_steps(self):
+        """
+        Passes complete steps to database, releases clients waiting for them
+        and makes the first incomplete step current
+        """
+        steps = self.steps
+        if self.forwarders:
+            self._forward() # values of steps are forwarded before they are finished
+        rows = []
+        now = time.perf_counter()
+        while steps and steps[0].missing == 0:
+            step = steps.popleft()
+            rows.append(step.row(self.TIME))
+            if self.history is not None:
+                self.history.append(step.time, step.values)
+            for request in self.subscriptions:
+                step.projection(request, self.TIME)
+            step.complete.set()
+            self.metrics.observe('gather', now - step.started)
+            if sampled(step.time + 1):
+                logger.info('Simulation %r next iteration, time: %d, waited for state: %.6f s',
+                            self.name, step.time + 1, now - step.started)
+        if not rows:
+            return
+        if not steps:
+            steps.append(Step(self.names, step.time + 1, self.links))
+            if self.forwarders:
+                self._forward()
+        self.metrics.add('steps', len(rows))
+        asyncio.get_running_loop().run_in_executor(self._executor, self._add, rows)
+
+    async def exchange(self, data, request):
+        """
+        Puts client data into current step, waits for full state update
+        and returns requested variables
+        """
+        return (await self.exchange_block([data], request))[0]
+
+    async def exchange_block(self, block, request):
+        """
+        Puts data of consecutive steps into current step and the following ones,
+        waits until all of them are complete
+        :param block: list of data dictionaries, one for every step
+        :param request: requested variables, frozenset for subscriptions
+        :return: list of requested variables of every step, shared with other clients
+        """
+        steps = self._open_steps(len(block))
+        for step, data in zip(steps, block):
+            step.update(data)
+        self._finish_steps()
+        last = steps[-1]
+        if not last.complete.is_set():
+            t = time.perf_counter()
+            await last.complete.wait()
+            self.metrics.observe('wait', time.perf_counter() - t)
+        if not isinstance(request, frozenset):
+            request = frozenset(request)
+        return [step.projection(request, self.TIME) for step in steps]
+
+    def _add(self, rows):
+        t = time.perf_counter()
+        for row in rows:
+            self.db_updater.add(row)
+        self.metrics.observe('db_add', time.perf_counter() - t)
+
+    def _commit(self):
+        t = time.perf_counter()
+        self.db_updater.commit()
+        self.metrics.observe('commit', time.perf_counter() - t)
+
+    async def commit_periodically(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.db_update_time)
+            await loop.run_in_executor(self._executor, self._commit)
+
+    def close(self):
+        """Stops periodic commits, remaining rows are written by executor before exit"""
+        self._committer.cancel()
+        self._executor.submit(self.db_updater.close)
+        self._executor.shutdown(wait=False)
+
+
+class AsyncServer(object):
+    """
+    Server engine serving all clients from one asyncio event loop.
+    Every simulation (see Simulation) keeps its step state in plain dict,
+    clients waiting for full state are released together when the last variable arrives.
+    Simulations other than the default one are created when a client names them
+    in session handshake, their database updaters are made by db_factory.
+    """
+    TIME = Simulation.TIME
+    # gather - from the first data of step to the last one, wait - client waiting for the others
+    PHASES = ['receive', 'wait', 'send', 'gather', 'db_add', 'commit']
+    COUNTERS = ['steps', 'exchanges', 'connections', 'clients']
+
+    def __init__(self, ip, port, db_updater, db_update_time=1, protocol=ConfirmationProtocolManager(),
+                 db_factory=None, sock=None, recreate_db=False, stats_interval=None, history=1000, buffer_size=None):
+        """
+        :param ip: phisical ip address of host machine or address of transport (e.g. unix:/tmp/server.sock)
+        :param port: indicates where to start searching for free tcp/ip port
+        :param db_updater: DatabaseUpdater (production mode), DatabaseUpdaterSimulator(sim mode)
+        :param db_update_time: seconds between database commits
+        :param protocol: object with methods send_async and receive_async
+        :param db_factory: function of simulation name returning its database updater,
+                           by default db_updater is recreated with database name suffixed by simulation name
+        :param sock: listening socket, if None server binds its own,
+                     False - server only serves connections passed to adopt
+        :param recreate_db: db_updater is only a template, default simulation also gets updater from db_factory
+        :param stats_interval: seconds between metrics written to log, None - metrics are only sent on request
+        :param history: number of recent steps kept by every simulation for history requests, 0 - none
+        :param buffer_size: socket buffers in bytes, None - system defaults
+        """
+        self.ip = ip
+        self.port = port
+        self.protocol = protocol
+        self.db_updater = db_updater
+        self.db_update_time = db_update_time
+        self.db_factory = db_factory if db_factory is not None else self.default_db_factory
+        self.recreate_db = recreate_db
+        self.names = [k for k in db_updater.table.COLUMNS if k != self.TIME]
+        self.arrays = table_arrays(db_updater.table)
+        self.simulations = {}
+        self.metrics = Metrics(self.PHASES, self.COUNTERS, threading) # database operations run in executor threads
+        self.stats_interval = stats_interval
+        self.history = history
+        self.links = 0 # links to other nodes taking part in every step of default simulation (see FederatedServer)
+        self._tasks = set() # event loop keeps only weak references to tasks of adopted connections
+
+        self.sock = sock
+        self.transport = None # connections passed to adopt are configured by their acceptor
+        if sock is None:
+            self.transport = parse_address(ip, port, buffer_size)
+            self.sock = self.transport.listen()
+            self.port = self.transport.port
+
+    def default_db_factory(self, name):
+        db_dict = self.db_updater.get_db_dict()
+        if name != ServerSession.DEFAULT_SIMULATION:
+            db_dict["database"] = "%s_%s" % (db_dict["database"], name)
+        return db_dict["class"].recreate_database_updater(db_dict)
+
+    def redirect(self, message):
+        """
+        Response sent instead of handshake response when client should be served by another server
+        (see FederatedServer), None when it is served here
+        """
+        return None
+
+    async def stream(self, simulation, session, reader, writer):
+        """Serves link of federation node after its handshake (see FederatedServer)"""
+        raise Exception('Server is not node of federation, link of node %s refused' % session.node)
+
+    def simulation(self, name):
+        """Returns simulation of given name, creates it when it is not running yet"""
+        simulation = self.simulations.get(name)
+        if simulation is None:
+            if name == ServerSession.DEFAULT_SIMULATION and not self.recreate_db:
+                db_updater = self.db_updater
+            else:
+                db_updater = self.db_factory(name)
+            links = self.links if name == ServerSession.DEFAULT_SIMULATION else 0
+            simulation = self.simulations[name] = Simulation(name, self.names, db_updater, self.db_update_time,
+                                                             self.metrics, self.history, links, self.arrays)
+            logger.info('Simulation %r created', name)
+        return simulation
+
+    async def serve_connection(self, reader, writer, first_message=None):
+        """
+        Serves one connection until client disconnects
+        :param first_message: message already received by process which passed the connection
+        """
+        session = ServerSession(self.names, self.TIME, binary=hasattr(self.protocol, 'BINARY'), arrays=self.arrays)
+        if self.transport is not None and first_message is None:
+            self.transport.configure(writer.get_extra_info('socket'))
+        simulation = None
+        metrics = self.metrics
+        metrics.add('connections')
+        metrics.add('clients')
+        try:
+            while True:
+                if first_message is not None:
+                    received_data, first_message = first_message, None
+                else:
+                    t = time.perf_counter()
+                    try:
+                        received_data = await self.protocol.receive_async(reader, writer)
+                    except ConnectionError:
+                        break
+                    received_data = session.decompress(received_data)
+                    metrics.observe('receive', time.perf_counter() - t)
+                if session.is_stats_request(received_data):
+                    await self.protocol.send_async(reader, writer, metrics.snapshot())
+                    continue
+                if simulation is None:
+                    simulation = self.simulation(session.simulation_name(received_data))
+                    simulation.clients += 1
+                    logger.info('connection from %s, simulation %r, clients: %d',
+                                writer.get_extra_info('peername'), simulation.name, simulation.clients)
+                if session.is_history_request(received_data):
+                    await self.protocol.send_async(reader, writer, session.history(received_data, simulation.history))
+                    continue
+                if session.is_handshake(received_data):
+                    redirect = self.redirect(received_data)
+                    if redirect is not None:
+                        await self.protocol.send_async(reader, writer, redirect)
+                        continue
+                    if session.request is not None:
+                        simulation.unsubscribe(session.request)
+                    response = session.handshake(received_data, simulation.step.time)
+                    if session.request is not None:
+                        simulation.subscribe(session.request)
+                    await self.protocol.send_async(reader, writer, response)
+                    if session.node is not None:
+                        await self.stream(simulation, session, reader, writer)
+                        break
+                    continue
+                try:
+                    if session.is_block(received_data):
+                        block, request = session.block(received_data)
+                    else:
+                        data, request = session.step(received_data)
+                except Exception as e:
+                    # invalid message is answered, connection is kept
+                    logger.error('Invalid message from %s: %s', writer.get_extra_info('peername'), e)
+                    await self.protocol.send_async(reader, writer, {ServerSession.ERROR: str(e)})
+                    continue
+                if session.is_block(received_data):
+                    response = session.block_response(await simulation.exchange_block(block, request))
+                else:
+                    response = session.response(await simulation.exchange(data, request))
+                t = time.perf_counter()
+                await self.protocol.send_async(reader, writer, response)
+                metrics.observe('send', time.perf_counter() - t)
+                metrics.add('exchanges')
+        except Exception as e:
+            logger.error('Serving %s failed: %s', writer.get_extra_info('peername'), e)
+        finally:
+            metrics.add('clients', -1)
+            if simulation is not None:
+                simulation.clients -= 1
+                if session.request is not None:
+                    simulation.unsubscribe(session.request)
+            writer.close()
+
+    async def adopt(self, sock, first_message, protocol_state):
+        """Serves connection accepted by another process, its first message was already received there"""
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        reader, writer = await asyncio.open_connection(sock=sock, limit=2 ** 24)
+        self.protocol.attach(writer, protocol_state)
+        await self.serve_connection(reader, writer, first_message)
+
+    async def serve(self):
+        try:
+            if self.sock is False:
+                await asyncio.Event().wait()
+            server = await asyncio.start_server(self.serve_connection, sock=self.sock, limit=2 ** 24)
+            async with server:
+                await server.serve_forever()
+        finally:
+            for simulation in self.simulations.values():
+                simulation.close()
+
+    def start(self):
+        """Server main loop, blocks until interrupted"""
+        start_dumping(self.metrics, self.stats_interval)
+        try:
+            asyncio.run(self.serve())
+        finally:
+            if self.sock:
+                self.sock.close()
+            if self.transport is not None:
+                self.transport.close()
@@ -0,0 +1,103 @@
+import logging
+import multiprocessing
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Value(object):
+    """Stand-in for multiprocessing Value shared only by threads (StepBarrier, StateHistory)"""
+
+    def __init__(self, value):
+        self.value = value
+
+
+class StepBarrier(object):
+    """
+    Reusable two phase barrier for one time step.
+    Serving workers: enter -> write data -> arrive -> wait_release -> read state -> leave.
+    Manager: wait_complete -> release -> wait_drained -> reset state -> advance.
+    Workers are woken together when the manager releases the step and
+    the manager is woken by the worker which delivered the last variable.
+    Nothing polls, all waits are done on one condition variable.
+    """
+
+    def __init__(self, ctx=multiprocessing):
+        """
+        :param ctx: multiprocessing (context) when workers are processes, threading when they are threads
+        """
+        self._cond = ctx.Condition()
+        if hasattr(ctx, 'Value'):
+            self._step = ctx.Value('q', 0, lock=False)
+            self._inside = ctx.Value('i', 0, lock=False)
+            self._released = ctx.Value('b', 0, lock=False)
+        else:
+            self._step = _Value(0)
+            self._inside = _Value(0)
+            self._released = _Value(0)
+        self._opened = time.perf_counter()
+
+    # serving workers
+
+    def enter(self):
+        """
+        Waits until previous step is drained
+        :return: number of entered step
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not self._released.value)
+            self._inside.value += 1
+            return self._step.value
+
+    def arrive(self):
+        """Wakes manager after data of worker was written to the state"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait_release(self, step):
+        """Waits until manager releases given step"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._released.value or self._step.value != step)
+
+    def leave(self):
+        """Worker does not need current state any more"""
+        with self._cond:
+            self._inside.value -= 1
+            self._cond.notify_all()
+
+    # manager
+
+    def wait_complete(self, predicate, timeout=None):
+        """
+        Waits until predicate (e.g. state is complete) is true,
+        it is checked whenever a worker arrives
+        :return: time in seconds since step was opened, None on timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(predicate, timeout):
+                return None
+        return time.perf_counter() - self._opened
+
+    def release(self):
+        """Lets all waiting workers read the state at once"""
+        with self._cond:
+            self._released.value = 1
+            self._cond.notify_all()
+
+    def wait_drained(self):
+        """
+        Waits until every released worker has left
+        :return: time of waiting in seconds
+        """
+        t = time.perf_counter()
+        with self._cond:
+            self._cond.wait_for(lambda: self._inside.value == 0)
+        return time.perf_counter() - t
+
+    def advance(self):
+        """Opens next step, workers waiting in enter may proceed"""
+        with self._cond:
+            self._step.value += 1
+            self._released.value = 0
+            self._opened = time.perf_counter()
+            self._cond.notify_all()
@@ -0,0 +1,60 @@
+import argparse
+import array
+import json
+import time
+
+from harness import start_server, stop_server
+from protocol import dumps, get_protocol
+
+"""
+Exchanges of one array variable (float64 profile) sent as JSON list and as raw buffer of binary codec.
+Client sends the profile every step and requests it back, so it travels both ways.
+Prints JSON lines with steps per second and bytes of sent message for every size and encoding.
+"""
+
+SIZES = [100, 1000, 10 ** 4, 10 ** 5]
+
+
+def run(engine, protocol, size, codec, steps):
+    from client import Client
+
+    server, address = start_server(engine, ['profile'], arrays={'profile': ('d', [size])},
+                                   protocol=get_protocol(protocol))
+    client = Client(address, protocol=get_protocol(protocol))
+    try:
+        client.open_session('profile', ['profile'], ['profile'], codec='schema' if codec else None)
+        if codec and client.session.codec is None:
+            raise Exception('Protocol %s does not carry binary messages' % protocol)
+        profile = array.array('d', [i * 0.001 for i in range(size)])
+        data = {'profile': profile}
+        message = client.session.codec.encode_step(data) if codec else dumps({"data": data})
+        start = time.perf_counter()
+        for _ in range(steps):
+            profile[0] += 1.0
+            response = client.exchange_data(data)
+        elapsed = time.perf_counter() - start
+        if list(response['profile'][:2]) != list(profile[:2]):
+            raise Exception('Profile was not returned')
+    finally:
+        client.close()
+        stop_server(server)
+    return steps / elapsed, len(message)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Array variable sent as JSON list and as raw buffer")
+    parser.add_argument('-e', '--engine', dest='engine', default='asyncio', choices=['process', 'asyncio', 'sharded'])
+    parser.add_argument('-p', '--protocol', dest='protocol', default='length')
+    parser.add_argument('-s', '--sizes', dest='sizes', type=int, nargs='*', default=SIZES, help='elements of profile')
+    parser.add_argument('-n', '--steps', dest='steps', type=int, default=200)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    for size in args.sizes:
+        for codec in (False, True):
+            rate, message = run(args.engine, args.protocol, size, codec, args.steps)
+            print(json.dumps({"benchmark": "array_transfer", "engine": args.engine, "protocol": args.protocol,
+                              "elements": size, "encoding": "codec" if codec else "json",
+                              "steps_per_s": rate, "message_bytes": message}))
@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import ROOT, latency_summary, start_server, stop_server
+
+"""
+Per step latency of MATLAB style client:
+python client_app.py started for every step vs one client_agent.py fed by stdin.
+One client sends all state variables, so steps are not delayed by other clients.
+"""
+
+VARIABLES = ['Fzco', 'Fzm', 'To', 'Tpco', 'Tpm', 'Tr', 'Tzco', 'Tzm']
+
+
+def summary(name, times):
+    result = {"client": name}
+    result.update(latency_summary(times))
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="client_app.py per step vs resident client_agent.py")
+    parser.add_argument('-n', '--steps', dest='steps', type=int, default=50)
+    parser.add_argument('-e', '--engine', dest='engine', default='asyncio', choices=['process', 'asyncio', 'sharded'])
+    parser.add_argument('-p', '--protocol', dest='protocol', default='confirmation')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    from protocol import get_protocol
+    from transport import ENDPOINT_FILE, write_endpoint
+    server, address = start_server(args.engine, protocol=get_protocol(args.protocol))
+    workdir = tempfile.mkdtemp()
+    try:
+        write_endpoint(address, os.path.join(workdir, ENDPOINT_FILE))
+        with open(os.path.join(workdir, 'input.json'), 'w') as f:
+            json.dump({k: 1.0 for k in VARIABLES}, f)
+        cli = [os.path.join(ROOT, 'client_app.py'), address, '0', 'out.json',
+               '-r'] + VARIABLES + ['-f', 'input.json', '-p', args.protocol]
+
+        spawned = []
+        for _ in range(args.steps):
+            t = time.perf_counter()
+            subprocess.run([sys.executable] + cli, cwd=workdir, check=True, stdout=subprocess.DEVNULL)
+            spawned.append(time.perf_counter() - t)
+
+        cli[0] = os.path.join(ROOT, 'client_agent.py')
+        agent = subprocess.Popen([sys.executable] + cli, cwd=workdir, stdin=subprocess.PIPE,
+                                 stdout=subprocess.PIPE, universal_newlines=True)
+        resident = []
+        for _ in range(args.steps):
+            t = time.perf_counter()
+            agent.stdin.write("\n")
+            agent.stdin.flush()
+            answer = agent.stdout.readline()
+            resident.append(time.perf_counter() - t)
+            if "error" in json.loads(answer):
+                raise Exception(answer)
+        agent.stdin.write("quit\n")
+        agent.stdin.close()
+        agent.wait()
+    finally:
+        stop_server(server)
+
+    for result in (summary("client_app.py", spawned), summary("client_agent.py", resident)):
+        print(json.dumps(result))
@@ -0,0 +1,52 @@
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from codec import SchemaCodec
+
+"""
+Compares size and encode/decode time of one exchange
+sent as JSON and with SchemaCodec.
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="JSON vs schema codec for one exchange")
+    parser.add_argument('-n', '--variables', dest='variables', type=int, default=8, help='number of variables in schema')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=10000)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    schema = ['Var%d' % i for i in range(args.variables)]
+    half = len(schema) // 2
+    data = {k: random.random() * 100 for k in schema[:half]}
+    request = schema[half:]
+    response = {k: random.random() * 100 for k in request}
+    response['time'] = 12345
+    codec = SchemaCodec(schema)
+
+    json_step = json.dumps({"data": data, "request": request}).encode("utf-8")
+    json_response = json.dumps(response).encode("utf-8")
+    schema_step = codec.encode_step(data, request)
+    schema_response = codec.encode_response(response)
+
+    cases = [
+        ("json", len(json_step), len(json_response),
+         lambda: json.loads(json.dumps({"data": data, "request": request}).encode("utf-8").decode("utf-8")),
+         lambda: json.loads(json.dumps(response).encode("utf-8").decode("utf-8"))),
+        ("schema", len(schema_step), len(schema_response),
+         lambda: codec.decode_step(codec.encode_step(data, request)),
+         lambda: codec.decode_response(codec.encode_response(response))),
+    ]
+    print("{:>8} {:>11} {:>15} {:>18} {:>22}".format("codec", "step [B]", "response [B]", "step enc+dec [us]", "response enc+dec [us]"))
+    for name, step_size, response_size, step, resp in cases:
+        t_step = timeit.timeit(step, number=args.repeat) / args.repeat * 1e6
+        t_resp = timeit.timeit(resp, number=args.repeat) / args.repeat * 1e6
+        print("{:>8} {:>11} {:>15} {:>18.2f} {:>22.2f}".format(name, step_size, response_size, t_step, t_resp))
@@ -0,0 +1,116 @@
+import argparse
+import json
+import math
+import socket
+import threading
+import time
+
+from harness import start_server, stop_server
+from protocol import get_protocol
+from transport import parse_address
+
+"""
+Break-even payload size of negotiated compression (see compression.py).
+Client sends all variables every step and requests all of them back, payload grows with number of variables.
+Every size is measured uncompressed, with zlib and with zlib and preset dictionary of the schema,
+on loopback and on throttled link: proxy in this process forwarding at --rate bytes per second
+with --delay seconds added to every forwarded chunk (rough model of slow network, no tc needed).
+Prints JSON line for every measurement and the smallest uncompressed message (bytes) at which compression wins
+on every link, null when it does not win at any measured size.
+"""
+
+SIZES = [10, 30, 100, 300, 1000, 3000]
+MODES = ['plain', 'zlib', 'zlib+zdict']
+
+
+class ThrottledProxy(object):
+    """Forwards tcp connections to target at limited rate"""
+
+    def __init__(self, target, rate, delay):
+        self.target = target
+        self.rate = rate
+        self.delay = delay
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.address = 'tcp:127.0.0.1:%d' % self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.sock.accept()
+            server = parse_address(self.target).connect()
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for src, dst in ((client, server), (server, client)):
+                threading.Thread(target=self._pipe, args=(src, dst), daemon=True).start()
+
+    def _pipe(self, src, dst):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                time.sleep(self.delay + len(data) / self.rate)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            dst.close()
+
+
+def values(columns, step):
+    """Smooth signals written with full precision, like states of simulated plant"""
+    return {k: 20.0 + 5.0 * math.sin(0.01 * step + i) for i, k in enumerate(columns)}
+
+
+def run(address, columns, mode, steps, threshold):
+    from client import Client
+
+    client = Client(address, protocol=get_protocol('length'))
+    try:
+        compression = None if mode == 'plain' else threshold
+        client.open_session('payload', columns, columns, compression=compression, zdict=mode == 'zlib+zdict')
+        message = {"data": values(columns, 0)}
+        size = len(json.dumps(message))
+        if client.session.compressor is not None:
+            size = len(client.session.compressor.compress(message))
+        start = time.perf_counter()
+        for step in range(steps):
+            client.exchange_data(values(columns, step))
+        return steps / (time.perf_counter() - start), size
+    finally:
+        client.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Break-even payload size of compression")
+    parser.add_argument('-s', '--sizes', dest='sizes', type=int, nargs='*', default=SIZES, help='numbers of variables')
+    parser.add_argument('-n', '--steps', dest='steps', type=int, default=100)
+    parser.add_argument('--rate', dest='rate', type=float, default=1e6, help='bytes per second of throttled link')
+    parser.add_argument('--delay', dest='delay', type=float, default=0.001, help='seconds added to every chunk')
+    parser.add_argument('--threshold', dest='threshold', type=int, default=0, help='compression threshold in bytes')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    links = ['loopback', 'throttled']
+    break_even = dict.fromkeys(links)
+    for link in links:
+        for n in args.sizes:
+            columns = ['v%d' % i for i in range(n)]
+            server, address = start_server('asyncio', columns, protocol=get_protocol('length'))
+            proxy = ThrottledProxy(address, args.rate, args.delay) if link == 'throttled' else None
+            try:
+                rates, sizes = {}, {}
+                for mode in MODES:
+                    rate, size = run(proxy.address if proxy else address, columns, mode, args.steps, args.threshold)
+                    rates[mode], sizes[mode] = rate, size
+                    print(json.dumps({"benchmark": "compression", "link": link, "variables": n, "mode": mode,
+                                      "message_bytes": size, "steps_per_s": rate}))
+                if break_even[link] is None and max(rates['zlib'], rates['zlib+zdict']) > rates['plain']:
+                    break_even[link] = sizes['plain']
+            finally:
+                stop_server(server)
+    print(json.dumps({"benchmark": "compression", "break_even_bytes": break_even,
+                      "rate": args.rate, "delay": args.delay}))
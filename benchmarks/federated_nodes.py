@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Barrier, Process, Queue
+
+from harness import ROOT, start_server, stop_server
+from protocol import get_protocol
+
+"""
+Federated nodes vs one server for clusters of clients.
+Every cluster has its own variables (one per client) and imports --coupling variables
+of the next cluster. Federation runs one node per cluster (server.py --federation)
+connected by unix sockets, the same clients are then served by one asyncio server.
+Prints JSON with step rates and values forwarded between nodes per step.
+"""
+
+
+def cluster_variables(cluster, clients):
+    return ['c%dv%d' % (cluster, i) for i in range(clients)]
+
+
+def federation(args, workdir):
+    nodes = {}
+    for c in range(args.clusters):
+        peer = (c + 1) % args.clusters
+        imports = cluster_variables(peer, args.clients)[:args.coupling] if args.clusters > 1 else []
+        nodes['n%d' % c] = {"address": "unix:" + os.path.join(workdir, 'n%d.sock' % c),
+                            "variables": cluster_variables(c, args.clients), "imports": imports}
+    return nodes
+
+
+def run_client(address, name, data, request, steps, start, results):
+    from client import Client
+
+    client = Client(address, protocol=get_protocol('length'))
+    try:
+        client.open_session(name, data, request)
+        start.wait()
+        t = time.perf_counter()
+        for step in range(steps):
+            client.exchange_data({k: float(step) for k in data})
+        results.put(time.perf_counter() - t)
+    except Exception as e:
+        results.put(str(e))
+    finally:
+        client.close()
+
+
+def run_clients(args, nodes, address_of):
+    """Runs all clients, :return: steps per second"""
+    start = Barrier(args.clusters * args.clients)
+    results = Queue()
+    clients = []
+    for node, config in sorted(nodes.items()):
+        for i, k in enumerate(config["variables"]):
+            # the first client of cluster also reads imported variables
+            request = [config["variables"][(i + 1) % len(config["variables"])]] + (config["imports"] if i == 0 else [])
+            clients.append(Process(target=run_client, args=(address_of(node), '%s.%d' % (node, i), [k], request,
+                                                            args.steps, start, results)))
+    for p in clients:
+        p.start()
+    times = [results.get(timeout=args.timeout) for _ in clients]
+    for p in clients:
+        p.join()
+    errors = [t for t in times if isinstance(t, str)]
+    if errors:
+        raise Exception('Clients failed: %s' % errors)
+    return args.steps / max(times)
+
+
+def stats(address):
+    from client import Client
+
+    client = Client(address, protocol=get_protocol('length'))
+    try:
+        return client.stats()
+    finally:
+        client.close()
+
+
+def wait_listening(address, timeout=30):
+    from transport import parse_address
+
+    transport = parse_address(address)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            transport.connect().close()
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def wait_linked(address, links, timeout=30):
+    """Waits until links of nodes exporting to node are connected, connection asking for stats is counted as well"""
+    deadline = time.time() + timeout
+    while stats(address)["counters"]["clients"] <= links:
+        if time.time() > deadline:
+            raise Exception('Links to %s were not connected' % address)
+        time.sleep(0.1)
+
+
+def run_federation(args, nodes, workdir):
+    path = os.path.join(workdir, 'federation.json')
+    with open(path, 'w') as f:
+        json.dump({"nodes": nodes}, f)
+    servers = [subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py'), '--engine', 'asyncio',
+                                 '--protocol', 'length', '--db-writer', 'columnar', '--db-file', '%s.col' % node,
+                                 '--federation', path, '--node', node],
+                                cwd=workdir, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+               for node in sorted(nodes)]
+    try:
+        for config in nodes.values():
+            wait_listening(config["address"])
+        for config in nodes.values():
+            sources = [peer for peer in nodes.values() if set(peer["variables"]) & set(config["imports"])]
+            wait_linked(config["address"], len(sources))
+        rate = run_clients(args, nodes, lambda node: nodes[node]["address"])
+        counters = {node: stats(config["address"])["counters"] for node, config in nodes.items()}
+    finally:
+        for p in servers:
+            p.kill()
+            p.wait()
+    forwarded = {node: c["forwarded"] / float(c["steps"]) for node, c in counters.items()}
+    return rate, forwarded
+
+
+def run_single(args, nodes, workdir):
+    columns = [k for config in nodes.values() for k in config["variables"]]
+    server, address = start_server('asyncio', columns, 'unix:' + os.path.join(workdir, 'single.sock'),
+                                   protocol=get_protocol('length'))
+    try:
+        return run_clients(args, nodes, lambda node: address)
+    finally:
+        stop_server(server)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="federated nodes vs one server")
+    parser.add_argument('-k', '--clusters', dest='clusters', type=int, default=3)
+    parser.add_argument('-c', '--clients', dest='clients', type=int, default=4, help='clients of every cluster')
+    parser.add_argument('--coupling', dest='coupling', type=int, default=1,
+                        help='variables every cluster imports from the next one')
+    parser.add_argument('-n', '--steps', dest='steps', type=int, default=500)
+    parser.add_argument('--timeout', dest='timeout', type=float, default=600, help='seconds to wait for clients')
+    args = parser.parse_args()
+    if args.coupling > args.clients:
+        parser.error('cluster has only %d variables' % args.clients)
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    workdir = tempfile.mkdtemp()
+    nodes = federation(args, workdir)
+    federated, forwarded = run_federation(args, nodes, workdir)
+    single = run_single(args, nodes, workdir)
+    print(json.dumps({
+        "benchmark": "federation",
+        "clusters": args.clusters,
+        "clients_per_cluster": args.clients,
+        "coupling": args.coupling,
+        "steps": args.steps,
+        "federated_steps_per_s": federated,
+        "single_steps_per_s": single,
+        "forwarded_per_step": forwarded,
+    }))
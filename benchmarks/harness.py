@@ -0,0 +1,70 @@
+import os
+import signal
+import sys
+from multiprocessing import Process, Queue
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+"""
+Starts server for benchmarks in separate process,
+database operations are simulated by DatabaseUpdaterSimulator
+"""
+
+
+def _serve(queue, engine, columns, address, arrays, kwargs):
+    os.setpgrp() # stop_server kills server with all processes created by it
+    from async_server import AsyncServer
+    from database_updater_simulator import DatabaseUpdaterSimulator
+    from server import Server
+    from session_server import ShardedServer
+
+    table = DatabaseUpdaterSimulator.StateSimulator
+    if columns is not None:
+        table = type('BenchmarkState', (table,), {'COLUMNS': set(columns) | {'time'}, 'ARRAYS': arrays or {}})
+    server_class = {'asyncio': AsyncServer, 'sharded': ShardedServer}.get(engine, Server)
+    server = server_class(address or '127.0.0.1', 15000, DatabaseUpdaterSimulator('', '', '', table=table), **kwargs)
+    queue.put(server.transport.address)
+    server.start()
+
+
+def start_server(engine='process', columns=None, address=None, arrays=None, **kwargs):
+    """
+    :param engine: 'process' (Server), 'asyncio' (AsyncServer) or 'sharded' (ShardedServer)
+    :param columns: state variables, default are columns of StateSimulator
+    :param address: address of server (see transport.parse_address), free tcp port of localhost by default
+    :param arrays: array variables among columns, {name: (typecode, shape)} (see arrays.py)
+    :param kwargs: passed to server constructor
+    :return: server process and address it listens on
+    """
+    queue = Queue()
+    p = Process(target=_serve, args=(queue, engine, columns, address, arrays, kwargs))
+    p.start()
+    return p, queue.get(timeout=30)
+
+
+def stop_server(p):
+    """Stops server process along with processes created by it"""
+    try:
+        os.killpg(p.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    p.join(5)
+
+
+def percentile(sorted_times, q):
+    """Nearest rank percentile of sorted sample, q in range 0-100"""
+    return sorted_times[min(len(sorted_times) - 1, max(0, int(round(q / 100.0 * len(sorted_times))) - 1))]
+
+
+def latency_summary(times):
+    """:return: mean, p50, p95, p99 and max of times (seconds) in milliseconds"""
+    times = sorted(times)
+    summary = {"samples": len(times)}
+    if not times:
+        return summary
+    summary["mean_ms"] = sum(times) / len(times) * 1e3
+    for q in (50, 95, 99):
+        summary["p%d_ms" % q] = percentile(times, q) * 1e3
+    summary["max_ms"] = times[-1] * 1e3
+    return summary
@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from multiprocessing import Barrier, Process, Queue
+
+from harness import latency_summary, start_server, stop_server
+
+"""
+Multi-client load benchmark.
+Starts server in DatabaseUpdaterSimulator mode and runs every client in its own process.
+State variables are split between clients, so every step needs data of all of them.
+Prints one JSON object with configuration, step throughput and step latency percentiles,
+results of runs may be collected in file (--output) and compared run over run.
+"""
+
+
+def variables(n):
+    return ['v%d' % i for i in range(n)]
+
+
+def client_variables(names, clients, i):
+    """Variables sent by i-th client"""
+    return names[i::clients]
+
+
+def run_client(i, args, address, start, results):
+    from client import Client
+    from codec import SchemaCodec
+    from protocol import get_protocol
+
+    names = variables(args.variables)
+    mine = client_variables(names, args.clients, i)
+    others = [k for k in names if k not in set(mine)]
+    request = others[:args.request] if args.request is not None else others
+    client = Client(address, protocol=get_protocol(args.protocol))
+    times = []
+    try:
+        if args.session:
+            client.open_session('load%d' % i, mine, request, SchemaCodec.NAME if args.codec else None)
+        data = {k: 0.0 for k in mine}
+        if args.padding:
+            data['padding'] = 'x' * args.padding # not a state variable, only makes messages larger
+        start.wait()
+        for step in range(args.warmup + args.steps):
+            for k in mine:
+                data[k] = float(step)
+            t = time.perf_counter()
+            if step == args.warmup:
+                first = t
+            client.exchange_data(data, request)
+            if step >= args.warmup:
+                times.append(time.perf_counter() - t)
+        results.put((i, first, time.perf_counter(), times))
+    except Exception as e:
+        results.put((i, None, None, str(e)))
+    finally:
+        client.close()
+
+
+def run(args):
+    from protocol import get_protocol
+
+    kwargs = {}
+    if args.workers is not None:
+        kwargs['workers'] = args.workers
+    if args.max_exchanges is not None:
+        kwargs['max_exchanges'] = args.max_exchanges
+    address = None
+    if args.transport == 'unix':
+        address = 'unix:' + os.path.join(tempfile.mkdtemp(), 'server.sock')
+    server, address = start_server(args.engine, variables(args.variables), address,
+                                   protocol=get_protocol(args.protocol), **kwargs)
+    try:
+        start = Barrier(args.clients)
+        results = Queue()
+        clients = [Process(target=run_client, args=(i, args, address, start, results)) for i in range(args.clients)]
+        for p in clients:
+            p.start()
+        received = [results.get(timeout=args.timeout) for _ in clients]
+        for p in clients:
+            p.join()
+    finally:
+        stop_server(server)
+
+    errors = [r[3] for r in received if r[1] is None]
+    if errors:
+        raise Exception('Clients failed: %s' % errors)
+    began = min(r[1] for r in received)
+    ended = max(r[2] for r in received)
+    latencies = [t for r in received for t in r[3]]
+    return {
+        "benchmark": "load",
+        "engine": args.engine,
+        "protocol": args.protocol,
+        "transport": args.transport,
+        "session": args.session,
+        "codec": args.codec,
+        "clients": args.clients,
+        "variables": args.variables,
+        "request": args.request,
+        "padding": args.padding,
+        "steps": args.steps,
+        "python": platform.python_version(),
+        "duration_s": ended - began,
+        "steps_per_s": args.steps / (ended - began),
+        "latency": latency_summary(latencies),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="step throughput and latency with many clients")
+    parser.add_argument('-e', '--engine', dest='engine', default='process', choices=['process', 'asyncio', 'sharded'])
+    parser.add_argument('-p', '--protocol', dest='protocol', default='confirmation')
+    parser.add_argument('-t', '--transport', dest='transport', default='tcp', choices=['tcp', 'unix'],
+                        help='tcp over loopback or unix domain socket')
+    parser.add_argument('-c', '--clients', dest='clients', type=int, default=2)
+    parser.add_argument('-v', '--variables', dest='variables', type=int, default=8, help='number of state variables')
+    parser.add_argument('-r', '--request', dest='request', type=int,
+                        help='number of variables requested by every client, all not sent by it by default')
+    parser.add_argument('--padding', dest='padding', type=int, default=0,
+                        help='bytes of filler added to every sent message (JSON only)')
+    parser.add_argument('-n', '--steps', dest='steps', type=int, default=200)
+    parser.add_argument('--warmup', dest='warmup', type=int, default=10, help='steps not measured')
+    parser.add_argument('-s', '--session', dest='session', action='store_true', help='persistent connections')
+    parser.add_argument('--codec', dest='codec', action='store_true', help='schema codec (needs binary protocol and session)')
+    parser.add_argument('--workers', dest='workers', type=int, help='worker processes of sharded engine, pre-forked workers of process engine')
+    parser.add_argument('--max-exchanges', dest='max_exchanges', type=int,
+                        help='pre-forked worker of process engine is replaced after that many exchanges')
+    parser.add_argument('--timeout', dest='timeout', type=float, default=600, help='seconds to wait for clients')
+    parser.add_argument('-o', '--output', dest='output', help='file to which JSON line with result is appended')
+    args = parser.parse_args()
+    if args.codec and not args.session:
+        parser.error('--codec needs --session')
+    if args.codec and args.padding:
+        parser.error('--padding is not supported by --codec')
+    if args.clients > args.variables:
+        parser.error('every client needs at least one variable')
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    result = run(args)
+    line = json.dumps(result)
+    print(line)
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(line + '\n')
@@ -0,0 +1,81 @@
+import argparse
+import gc
+import multiprocessing
+import os
+import socket
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from protocol import PROTOCOLS
+
+"""
+Memory allocated by protocol.receive for payloads from 1 kB to 10 MB, traced by tracemalloc.
+Sender is forked process, so only allocations of receiving end are traced.
+peak/B - the highest memory allocated during receive per payload byte
+(decoded message itself takes about 2 B/B: text of JSON and the payload string),
+kept [kB] - memory still allocated after the message is dropped (reusable receive buffers).
+The first receive of every size grows buffers, the rest are steady state.
+"""
+
+SIZES = [1000, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+
+
+def send_all(protocol, sender, receiver, size, repeat):
+    receiver.close()
+    message = {"data": {"payload": "x" * size}}
+    for _ in range(repeat):
+        protocol.send(sender, message)
+    # stays connected until receiver is done, so its acknowledgements can be sent
+    while sender.recv(65536):
+        pass
+
+
+def measure(protocol, size, repeat):
+    """:return: (peak/B of the first receive, mean peak/B of the others, kept kB, mean receive time)"""
+    receiver, sender = socket.socketpair()
+    process = multiprocessing.Process(target=send_all, args=(protocol, sender, receiver, size, repeat))
+    process.start()
+    sender.close()
+    peaks = []
+    total = 0.0
+    try:
+        gc.collect()
+        tracemalloc.start()
+        initial = tracemalloc.get_traced_memory()[0]
+        for _ in range(repeat):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            start = time.perf_counter()
+            message = protocol.receive(receiver)
+            total += time.perf_counter() - start
+            peaks.append((tracemalloc.get_traced_memory()[1] - base) / size)
+            del message
+        kept = tracemalloc.get_traced_memory()[0] - initial
+        tracemalloc.stop()
+    finally:
+        receiver.close()
+        process.join()
+    steady = peaks[1:] or peaks
+    return peaks[0], sum(steady) / len(steady), kept / 1e3, total / repeat
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Allocations of protocol managers on receive")
+    parser.add_argument('-p', '--protocol', dest='protocols', nargs='*', default=sorted(PROTOCOLS), choices=sorted(PROTOCOLS))
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=5)
+    parser.add_argument('-s', '--sizes', dest='sizes', type=int, nargs='*', default=SIZES, help='payload sizes in bytes')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print("{:>14} {:>10} {:>14} {:>15} {:>10} {:>12}".format(
+        "protocol", "bytes", "first peak/B", "steady peak/B", "kept [kB]", "receive [s]"))
+    for name in args.protocols:
+        protocol = PROTOCOLS[name]()
+        for size in args.sizes:
+            first, steady, kept, t = measure(protocol, size, args.repeat)
+            print("{:>14} {:>10} {:>14.2f} {:>15.2f} {:>10.1f} {:>12.6f}".format(name, size, first, steady, kept, t))
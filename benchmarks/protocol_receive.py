@@ -0,0 +1,56 @@
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from protocol import PROTOCOLS
+
+"""
+Measures receive cost of protocol managers for payloads from 100 B to 10 MB.
+Sender runs in separate thread, both ends are connected with socketpair.
+Printed ns/B should stay flat for protocol with linear receive path.
+"""
+
+SIZES = [100, 1000, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+
+
+def measure(protocol, size, repeat):
+    """Returns mean time of protocol.receive for message with given payload size"""
+    message = {"data": {"payload": "x" * size}}
+    receiver, sender = socket.socketpair()
+    try:
+        def send_all():
+            for _ in range(repeat):
+                protocol.send(sender, message)
+        t = threading.Thread(target=send_all)
+        t.start()
+        total = 0.0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            protocol.receive(receiver)
+            total += time.perf_counter() - start
+        t.join()
+    finally:
+        receiver.close()
+        sender.close()
+    return total / repeat
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Receive cost per byte of protocol managers")
+    parser.add_argument('-p', '--protocol', dest='protocols', nargs='*', default=sorted(PROTOCOLS), choices=sorted(PROTOCOLS))
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=5)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print("{:>14} {:>10} {:>12} {:>10}".format("protocol", "bytes", "receive [s]", "ns/B"))
+    for name in args.protocols:
+        for size in SIZES:
+            t = measure(PROTOCOLS[name](), size, args.repeat)
+            print("{:>14} {:>10} {:>12.6f} {:>10.2f}".format(name, size, t, t * 1e9 / size))
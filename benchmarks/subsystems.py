@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+from harness import start_server, stop_server
+from protocol import get_protocol
+
+"""
+Steps of one process hosting several subsystems, every subsystem sends its own variables
+and reads variables of the next one, so none of them can finish a step alone
+(calling blocking Client.exchange_data of subsystems one after another deadlocks).
+Compared ways of exchanging data of all subsystems:
+threads - blocking Client of every subsystem in its own thread,
+async - AsyncClient of every subsystem, exchanges run concurrently in one event loop,
+group - ClientGroup of all subsystems sharing --connections connections.
+Prints JSON with steps per second of every mode.
+"""
+
+
+def subsystems(n, variables):
+    """:return: {name: (sent variables, requested variables)}"""
+    names = ['s%dv%d' % (i, j) for i in range(n) for j in range(variables)]
+    return {'s%d' % i: (names[i * variables:(i + 1) * variables], names[((i + 1) % n) * variables:][:1])
+            for i in range(n)}
+
+
+def run_threads(address, protocol, clients, steps):
+    from client import Client
+
+    def run(name, data, request, barrier):
+        client = Client(address, protocol=get_protocol(protocol))
+        try:
+            client.open_session(name, data, request)
+            barrier.wait()
+            for step in range(steps):
+                client.exchange_data({k: float(step) for k in data})
+        finally:
+            client.close()
+
+    barrier = threading.Barrier(len(clients) + 1)
+    threads = [threading.Thread(target=run, args=(name, data, request, barrier))
+               for name, (data, request) in clients.items()]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return steps / (time.perf_counter() - start)
+
+
+async def run_async(address, protocol, clients, steps):
+    from async_client import AsyncClient
+
+    connections = {name: AsyncClient(address, protocol=get_protocol(protocol)) for name in clients}
+    try:
+        await asyncio.gather(*[client.open_session(name, *clients[name]) for name, client in connections.items()])
+        start = time.perf_counter()
+        for step in range(steps):
+            await asyncio.gather(*[client.exchange({k: float(step) for k in clients[name][0]})
+                                   for name, client in connections.items()])
+        return steps / (time.perf_counter() - start)
+    finally:
+        await asyncio.gather(*[client.close() for client in connections.values()])
+
+
+async def run_group(address, protocol, clients, steps, connections):
+    from async_client import ClientGroup
+
+    async with ClientGroup(address, protocol=get_protocol(protocol), connections=connections) as group:
+        await group.open(clients)
+        start = time.perf_counter()
+        for step in range(steps):
+            await group.exchange({name: {k: float(step) for k in data} for name, (data, _) in clients.items()})
+        return steps / (time.perf_counter() - start)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Subsystems of one process exchanging data")
+    parser.add_argument('-e', '--engine', dest='engine', default='asyncio', choices=['process', 'asyncio', 'sharded'])
+    parser.add_argument('-p', '--protocol', dest='protocol', default='length')
+    parser.add_argument('-s', '--subsystems', dest='subsystems', type=int, default=8)
+    parser.add_argument('-v', '--variables', dest='variables', type=int, default=4, help='variables of every subsystem')
+    parser.add_argument('-n', '--steps', dest='steps', type=int, default=500)
+    parser.add_argument('-c', '--connections', dest='connections', type=int, default=1, help='connections of group')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    clients = subsystems(args.subsystems, args.variables)
+    columns = [k for data, _ in clients.values() for k in data]
+    results = {}
+    for mode in ['threads', 'async', 'group']:
+        # fresh server for every mode, so steps start from the beginning
+        server, address = start_server(args.engine, columns, protocol=get_protocol(args.protocol))
+        try:
+            if mode == 'threads':
+                results[mode] = run_threads(address, args.protocol, clients, args.steps)
+            elif mode == 'async':
+                results[mode] = asyncio.run(run_async(address, args.protocol, clients, args.steps))
+            else:
+                results[mode] = asyncio.run(run_group(address, args.protocol, clients, args.steps, args.connections))
+        finally:
+            stop_server(server)
+    print(json.dumps({
+        "benchmark": "subsystems",
+        "engine": args.engine,
+        "protocol": args.protocol,
+        "subsystems": args.subsystems,
+        "variables": args.variables,
+        "steps": args.steps,
+        "connections": args.connections,
+        "steps_per_s": results,
+    }))
@@ -1,10 +1,11 @@
 import argparse
 import json
 import logging
-import socket
 import warnings
 
-from protocol import ConfirmationProtocolManager
+from protocol import ConfirmationProtocolManager, PROTOCOLS, get_protocol
+from session import ClientSession
+from transport import parse_address
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.CRITICAL,filename='client.log',\
@@ -13,47 +14,132 @@ logging.basicConfig(level=logging.CRITICAL,filename='client.log',\
 
 class Client(object):
 
-    def __init__(self,ip,port,protocol=ConfirmationProtocolManager()):
+    def __init__(self,ip,port=None,protocol=ConfirmationProtocolManager(),buffer_size=None):
         """
         Creates Client object
-        :param ip: server ip
-        :param port: server tcp/ip port
+        :param ip: server ip or server address: tcp:host:port, unix:path (see read_endpoint)
+        :param port: server tcp/ip port, may be omitted when it is part of address
         :param protocol: object that sends and receives python data structures
+        :param buffer_size: socket buffers in bytes, None - system defaults
         """
         self.ip = ip
         self.port = port
         self.protocol = protocol
+        self.buffer_size = buffer_size
+        self.transport = parse_address(ip, port, buffer_size)
+        self.sock = None # connection kept by session
+        self.session = None # ClientSession of that connection
 
     def _connect(self):
         """ Connects to server socket """
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_address = (self.ip,self.port)
-        logger.info('connecting to %s port %s' % server_address)
-        sock.connect(server_address)
-        return sock
+        return self.transport.connect()
 
-    def exchange_data(self, data, request):
+    def open_session(self, name=None, data=None, request=None, codec=None, simulation=None, delta=False,
+                     compression=None, zdict=False):
         """
-        High level communication with server
-        :param data: python data structure to send
-        :param request: list of requested variables' names
-        :return: requested data
+        Connects to server once, next exchanges use the same connection
+        until close is called
+        :param name: client identity
+        :param data: names of variables sent by client, checked by server
+        :param request: list of requested variables' names, used when exchange_data gets none
+        :param codec: 'schema' asks for binary messages, JSON is used when server or protocol does not support it
+        :param simulation: name of simulation to join on server hosting many of them
+        :param delta: only changed values are sent in both directions, exchange_data still takes
+                      and returns full dictionaries
+        :param compression: messages of at least that many bytes are compressed with zlib in both directions,
+                            None - no compression, server and protocol have to support bytes (see compression.py)
+        :param zdict: compression uses preset dictionary built from names of server variables
+        :return: server response to handshake
+        Node of federated server redirects session to node owning data of client,
+        the client stays connected to that node afterwards.
+        """
+        self.close()
+        self.sock = self._connect()
+        session = ClientSession(name, data, request, codec, simulation, delta, compression, zdict)
+        try:
+            self.protocol.send(self.sock, session.handshake())
+            response = self.protocol.receive(self.sock)
+            redirect = session.start(response)
+        except:
+            self.close()
+            raise
+        if redirect is not None:
+            self.close()
+            self.ip, self.port = redirect, None
+            self.transport = parse_address(self.ip, None, self.buffer_size)
+            return self.open_session(name, data, request, codec, simulation, delta, compression, zdict)
+        self.session = session
+        return response
+
+    def _exchange_message(self, build, parse):
+        """
+        Exchanges message of session, without session it is sent as plain JSON on new connection
+        :param build: function of ClientSession returning message
+        :param parse: function of ClientSession and received response returning result
         """
+        if self.sock is not None:
+            self.protocol.send(self.sock, build(self.session))
+            return parse(self.session, self.protocol.receive(self.sock))
+        session = ClientSession()
+        # when sock was object field and server run one process in a while time was worse
+        sock = self._connect()
         try:
-            # when sock was object field and server run one process in a while time was worse
-            sock = self._connect()
-            logger.info("Results: %s", data)
-            logger.info('Request: %s', request)
-            data_to_send = dict()
-            data_to_send["data"] = data
-            data_to_send["request"] = request
-            self.protocol.send(sock, data_to_send)
-
-            received_data = self.protocol.receive(sock)
-            logger.info("Answer: %s", received_data)
+            self.protocol.send(sock, build(session))
+            return parse(session, self.protocol.receive(sock))
         finally:
-            logger.info('error in client\'s exchange_data')
             sock.close()
-        return received_data
 
+    def exchange_block(self, block, request=None):
+        """
+        Exchanges several consecutive steps in one round trip
+        :param block: list of data dictionaries, one for every step
+        :param request: list of requested variables' names, may be omitted if declared in session
+        :return: list of requested data of every step
+        """
+        return self._exchange_message(lambda session: session.block(block, request),
+                                      lambda session, response: session.block_response(response, request))
+
+    def stats(self):
+        """
+        Asks server for its metrics, session connection is used when it is open
+        :return: counters and phase latencies (see metrics.Metrics.snapshot)
+        """
+        return self._exchange_message(ClientSession.stats, ClientSession.unpack)
 
+    def history(self, variables=None, first=None, last=None):
+        """
+        Asks server for values of recent steps kept in its memory
+        :param variables: names of variables, all when None
+        :param first: first step, the oldest kept when None
+        :param last: last step, the newest when None
+        :return: {"time": [steps], name: [values]}
+        """
+        return self._exchange_message(lambda session: session.history(variables, first, last),
+                                      ClientSession.history_response)
+
+    def close(self):
+        """Ends session"""
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def exchange_data(self, data, request=None):
+        """
+        High level communication with server
+        :param data: python data structure to send
+        :param request: list of requested variables' names, may be omitted if declared in session
+        :return: requested data
+        """
+        logger.debug("Results: %s", data)
+        logger.debug('Request: %s', request)
+        received_data = self._exchange_message(lambda session: session.step(data, request),
+                                               lambda session, response: session.step_response(response, request))
+        logger.debug("Answer: %s", received_data)
+        return received_data
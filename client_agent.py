@@ -0,0 +1,142 @@
+import json
+import logging
+import sys
+import threading
+
+from client import Client
+from client_app import arg_parser, parse_args
+from codec import SchemaCodec
+from protocol import get_protocol
+from transport import UnixTransport, read_endpoint
+
+logger = logging.getLogger(__name__)
+
+
+class ClientAgent(object):
+    """
+    Long running client for simulators which should not start python every step (MATLAB/Simulink).
+    Keeps session with the server open and exchanges data when asked by local line based channel:
+        empty line - sends data from file (read again every step) or from string given at start
+        JSON object - sends it as data, {"data": ..., "request": [...]} overrides request as well
+        quit - stops agent
+    Every answer is written as one JSON line and to output file, like client_app.py does.
+    """
+    QUIT = "quit"
+
+    def __init__(self, client, request, file=None, data=None, outputfile=None, name=None):
+        """
+        :param client: Client used for exchanges, its session is opened by agent
+        :param request: list of requested variables' names
+        :param file: file with JSON data, read before every step sent by empty line
+        :param data: data sent by empty line when there is no file
+        :param outputfile: every answer is also written to this file
+        :param name: client identity sent in session handshake
+        """
+        self.client = client
+        self.request = request
+        self.file = file
+        self.data = data
+        self.outputfile = outputfile
+        self.name = name
+
+    def default_data(self):
+        if self.file is not None:
+            with open(self.file, "r") as f:
+                return json.load(f)
+        return self.data
+
+    def connect(self):
+        data = self.default_data() or {}
+        codec = SchemaCodec.NAME if hasattr(self.client.protocol, 'BINARY') else None
+        return self.client.open_session(self.name, list(data.keys()), self.request, codec)
+
+    def handle(self, line):
+        """
+        Exchanges data described by line
+        :return: answer line, None when agent should stop
+        """
+        line = line.strip()
+        if line == self.QUIT:
+            return None
+        try:
+            if self.client.sock is None:
+                self.connect()
+            request = None
+            if line:
+                data = json.loads(line)
+                if "data" in data:
+                    request = data.get("request")
+                    data = data["data"]
+            else:
+                data = self.default_data()
+            data_received = self.client.exchange_data(data, request)
+        except Exception as e:
+            logger.error(e)
+            self.client.close() # connection is opened again for the next step
+            return json.dumps({"error": str(e)})
+        if self.outputfile is not None:
+            with open(self.outputfile, "w+") as of:
+                json.dump(data_received, of)
+        return json.dumps(data_received)
+
+    def serve_stdio(self, stdin=sys.stdin, stdout=sys.stdout):
+        """Answers lines from stdin until quit or end of input"""
+        try:
+            for line in stdin:
+                answer = self.handle(line)
+                if answer is None:
+                    break
+                stdout.write(answer + "\n")
+                stdout.flush()
+        finally:
+            self.client.close()
+
+    def serve_stream(self, connection):
+        """Answers lines from local socket until quit or disconnection"""
+        with connection, connection.makefile("rw", encoding="utf-8", newline="\n") as stream:
+            self.serve_stdio(stream, stream)
+
+
+def serve_unix(path, make_agent):
+    """
+    Listens on unix socket, every local connection gets its own agent
+    (own session with the server) served by separate thread
+    """
+    transport = UnixTransport(path)
+    sock = transport.listen(16) # refuses to replace file which is not stale socket
+    logger.info('agent listening on %s', path)
+    try:
+        while True:
+            connection, _ = sock.accept()
+            threading.Thread(target=make_agent().serve_stream, args=(connection,), daemon=True).start()
+    finally:
+        sock.close()
+        transport.close()
+
+
+def parse_agent_args():
+    """client_app.py arguments and agent options"""
+    parser = arg_parser()
+    parser.description = "Long running client app, exchanges data for every line of input"
+    parser.add_argument('-u', '--unix', dest='unix', metavar='socket_path',\
+                        help='serve local connections on unix socket instead of stdin/stdout')
+    parser.add_argument('-n', '--name', dest='name', help='client name sent to the server')
+    return parse_args(parser)
+
+
+if __name__ == "__main__":
+    args = parse_agent_args()
+
+    # endpoint file is used like in client_app.py
+    endpoint = read_endpoint()
+    if endpoint is not None:
+        args.ip, args.port = endpoint, None
+
+    def make_agent():
+        client = Client(args.ip, args.port, get_protocol(args.protocol))
+        return ClientAgent(client, args.request, args.file, args.string, args.outputfile, args.name)
+
+    if args.unix:
+        serve_unix(args.unix, make_agent)
+    else:
+        make_agent().serve_stdio()
@@ -1,7 +1,8 @@
 from client import *
+from transport import read_endpoint
 
-def parse_args():
-    """Parses arguments from terminal"""
+def arg_parser():
+    """Command line arguments of client app"""
     parser = argparse.ArgumentParser(description="Sets up client app")
     parser.add_argument(dest='ip')
     parser.add_argument(dest='port')
@@ -11,7 +12,14 @@ def parse_args():
     parser.add_argument('-s', '--string', dest='string', metavar='string_to_send',help="Example: -s \"{\"a\":1,\"b\":2}\"")
     parser.add_argument('-l', '--logfile', dest='logfile')
     parser.add_argument('-c', '--console', dest='console',action='store_true')
+    parser.add_argument('-p', '--protocol', dest='protocol', default='confirmation', choices=sorted(PROTOCOLS))
+    return parser
+
 
+def parse_args(parser=None):
+    """Parses arguments from terminal"""
+    if parser is None:
+        parser = arg_parser()
     args = parser.parse_args()
 
     if not (args.file is None):
@@ -29,12 +37,12 @@ def parse_args():
 if __name__=="__main__":
     args = parse_args()
 
-    # TODO remove f operations
-    f = open('port.txt')
-    port = int(f.__next__()) # overwriting args
-    args.port = port
+    # address of server started in the same directory overrides args
+    endpoint = read_endpoint()
+    if endpoint is not None:
+        args.ip, args.port = endpoint, None
 
-    client = Client(args.ip,args.port)
+    client = Client(args.ip,args.port,get_protocol(args.protocol))
     data_received = client.exchange_data(args.string,args.request)
     with open(args.outputfile,"w+") as of:
         json.dump(data_received,of)
@@ -0,0 +1,120 @@
+import struct
+
+
+class SchemaCodec(object):
+    """
+    Packs exchanged messages with schema (ordered list of variable names)
+    published by the server in session handshake. Names are replaced with
+    their indexes in schema and values are sent as float64, all little endian.
+
+    step:     uint16 number of data variables, uint16 number of requested variables
+              (NO_REQUEST when request declared in session is used),
+              uint16 indexes of data variables, uint16 indexes of requested variables,
+              float64 values of data variables
+    response: int64 time, uint16 number of variables, uint16 indexes, float64 values
+
+    Variables which are None are left out of index list, NaN is sent and received as NaN.
+    Array variables (see arrays.py) follow scalar part of both messages when some are sent:
+    uint16 number of arrays, (uint16 index, uint32 length) of every array,
+    raw little endian bytes of arrays one after another. Arrays which are None are not sent.
+    """
+    NAME = "schema"
+    NO_REQUEST = 0xFFFF
+    STEP_HEADER = struct.Struct('<HH')
+    RESPONSE_HEADER = struct.Struct('<qH')
+    ARRAYS_HEADER = struct.Struct('<H')
+    ARRAY_HEADER = struct.Struct('<HI')
+
+    def __init__(self, variables, time_name="time", arrays=None):
+        """
+        :param variables: schema, list of variable names
+        :param time_name: name of step counter in responses
+        :param arrays: {name: ArrayVariable} of array variables in schema
+        """
+        if len(variables) >= self.NO_REQUEST:
+            raise Exception('Schema is too long: %d variables' % len(variables))
+        self.variables = list(variables)
+        self.time_name = time_name
+        self.index = {k: i for i, k in enumerate(self.variables)}
+        self.arrays = arrays or {}
+
+    def _indexes(self, names):
+        try:
+            return [self.index[k] for k in names]
+        except KeyError as e:
+            raise Exception('Variable %s is not in schema' % e)
+
+    def _split(self, data):
+        """:return: names of scalar variables and names of arrays, variables which are None are left out"""
+        arrays = self.arrays
+        names = [k for k, v in data.items() if v is not None]
+        if not arrays:
+            return names, []
+        return [k for k in names if k not in arrays], [k for k in names if k in arrays]
+
+    def _encode_arrays(self, data, names):
+        """:return: parts of array section"""
+        if not names:
+            return []
+        buffers = [self.arrays[k].encode(data[k]) for k in names]
+        headers = [self.ARRAY_HEADER.pack(i, len(b)) for i, b in zip(self._indexes(names), buffers)]
+        return [self.ARRAYS_HEADER.pack(len(names))] + headers + buffers
+
+    def _decode_arrays(self, payload, offset, data):
+        """Puts arrays which follow scalar part at offset into data"""
+        if offset >= len(payload):
+            return
+        k, = self.ARRAYS_HEADER.unpack_from(payload, offset)
+        offset += self.ARRAYS_HEADER.size
+        headers = [self.ARRAY_HEADER.unpack_from(payload, offset + j * self.ARRAY_HEADER.size) for j in range(k)]
+        offset += k * self.ARRAY_HEADER.size
+        payload = memoryview(payload)
+        for i, length in headers:
+            name = self.variables[i]
+            if name not in self.arrays:
+                raise Exception('Variable %s is not array' % name)
+            data[name] = self.arrays[name].decode(payload[offset:offset + length])
+            offset += length
+
+    def encode_step(self, data, request=None):
+        names, arrays = self._split(data)
+        indexes = self._indexes(names)
+        request_indexes = [] if request is None else self._indexes(request)
+        n, m = len(indexes), len(request_indexes)
+        scalars = self.STEP_HEADER.pack(n, self.NO_REQUEST if request is None else m) + \
+            struct.pack('<%dH%dd' % (n + m, n), *(indexes + request_indexes + [data[k] for k in names]))
+        if not arrays:
+            return scalars
+        return b''.join([scalars] + self._encode_arrays(data, arrays))
+
+    def decode_step(self, payload):
+        """:return: data dictionary and request list (None when request was not sent)"""
+        n, m = self.STEP_HEADER.unpack_from(payload)
+        has_request = m != self.NO_REQUEST
+        if not has_request:
+            m = 0
+        fields = struct.unpack_from('<%dH%dd' % (n + m, n), payload, self.STEP_HEADER.size)
+        variables = self.variables
+        data = {variables[i]: v for i, v in zip(fields[:n], fields[n + m:])}
+        request = [variables[i] for i in fields[n:n + m]] if has_request else None
+        self._decode_arrays(payload, self.STEP_HEADER.size + 2 * (n + m) + 8 * n, data)
+        return data, request
+
+    def encode_response(self, data):
+        names, arrays = self._split(data)
+        names = [k for k in names if k != self.time_name]
+        n = len(names)
+        scalars = self.RESPONSE_HEADER.pack(data.get(self.time_name, 0), n) + \
+            struct.pack('<%dH%dd' % (n, n), *(self._indexes(names) + [data[k] for k in names]))
+        if not arrays:
+            return scalars
+        return b''.join([scalars] + self._encode_arrays(data, arrays))
+
+    def decode_response(self, payload):
+        time, n = self.RESPONSE_HEADER.unpack_from(payload)
+        fields = struct.unpack_from('<%dH%dd' % (n, n), payload, self.RESPONSE_HEADER.size)
+        variables = self.variables
+        data = {variables[i]: v for i, v in zip(fields[:n], fields[n:])}
+        data[self.time_name] = time
+        self._decode_arrays(payload, self.RESPONSE_HEADER.size + 10 * n, data)
+        return data
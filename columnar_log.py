@@ -0,0 +1,239 @@
+import argparse
+import getpass
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+
+from arrays import array_variables, table_arrays, to_json
+from database_updater_interface import DBUpdater
+from database_updater_simulator import DatabaseUpdaterSimulator
+
+logger = logging.getLogger(__name__)
+
+"""
+Append-only log of simulation states in local file, replacement of database for long runs.
+File starts with header page: magic, number of committed rows, column names (JSON).
+Rows follow in chunks of chunk_rows rows, inside chunk every column is stored
+contiguously as float64 (None is NaN), so columns are read as slices.
+Array columns (see arrays.py) are listed in header as [name, typecode, shape],
+every row of them holds raw little endian bytes of array padded to multiple of 8 bytes
+(missing array is stored as zeros).
+Only committed rows are valid: commit flushes rows first and then the row counter,
+after crash the log ends with the last commit.
+"""
+
+MAGIC = b'SSCLOG01'
+HEADER_SIZE = 4096
+_HEADER = struct.Struct('<8sQQII') # magic, committed rows, chunk rows, number of columns, length of names
+
+
+class ColumnarLog(object):
+    """Memory mapped log file, used by ColumnarLogUpdater and for reading finished logs"""
+
+    def __init__(self, path, columns=None, chunk_rows=4096, arrays=None):
+        """
+        :param path: log file
+        :param columns: names of columns of new log, existing log is opened for reading when None
+        :param chunk_rows: rows in one chunk of new log
+        :param arrays: {name: ArrayVariable} of array columns of new log
+        """
+        self.path = path
+        if columns is None:
+            self._file = open(path, 'rb')
+            header = self._file.read(HEADER_SIZE)
+            magic, self.rows, self.chunk_rows, n, length = _HEADER.unpack_from(header)
+            if magic != MAGIC:
+                raise Exception('%s is not columnar log' % path)
+            names = json.loads(header[_HEADER.size:_HEADER.size + length].decode('utf-8'))
+            self.columns = [k if isinstance(k, str) else k[0] for k in names]
+            self.arrays = array_variables({k[0]: k[1:] for k in names if not isinstance(k, str)})
+            self.writable = False
+        else:
+            self.columns = list(columns)
+            self.arrays = {k: v for k, v in (arrays or {}).items() if k in self.columns}
+            self.chunk_rows = chunk_rows
+            self.rows = 0
+            names = json.dumps([[k] + self.arrays[k].declaration() if k in self.arrays else k
+                                for k in self.columns]).encode('utf-8')
+            if _HEADER.size + len(names) > HEADER_SIZE:
+                raise Exception('Too many columns for log header: %d' % len(self.columns))
+            self._file = open(path, 'w+b')
+            self._file.write(_HEADER.pack(MAGIC, 0, chunk_rows, len(self.columns), len(names)) + names)
+            self._file.truncate(HEADER_SIZE)
+            self.writable = True
+        self._index = {k: i for i, k in enumerate(self.columns)}
+        # float64 slots of column in one row and offset of column in chunk
+        self._slots = [(self.arrays[k].nbytes + 7) // 8 if k in self.arrays else 1 for k in self.columns]
+        self._offsets = [self.chunk_rows * sum(self._slots[:i]) for i in range(len(self.columns))]
+        self._chunk_size = self.chunk_rows * sum(self._slots) # float64 values in chunk
+        self._mmap = None
+        self._values = None
+        self._map()
+
+    def _map(self):
+        """Maps whole file, values are seen as float64 array following header"""
+        self._unmap()
+        size = os.fstat(self._file.fileno()).st_size
+        access = mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ
+        self._mmap = mmap.mmap(self._file.fileno(), size, access=access)
+        self._values = memoryview(self._mmap)[HEADER_SIZE:].cast('d')
+        self.capacity = len(self._values) // self._chunk_size * self.chunk_rows if self._chunk_size else 0
+
+    def _unmap(self):
+        if self._values is not None:
+            self._values.release()
+            self._values = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _grow(self):
+        """Adds chunks to file, number of chunks is doubled up to 1024 at once"""
+        chunks = self.capacity // self.chunk_rows
+        chunks += min(max(chunks, 1), 1024)
+        self._file.truncate(HEADER_SIZE + chunks * self._chunk_size * 8)
+        self._map()
+
+    def append(self, row):
+        """Writes row after the last one, it is valid after flush"""
+        n = self.rows
+        if n >= self.capacity:
+            self._grow()
+        chunk, offset = divmod(n, self.chunk_rows)
+        base = chunk * self._chunk_size
+        values = self._values
+        arrays = self.arrays
+        for i, k in enumerate(self.columns):
+            v = row.get(k)
+            if k in arrays:
+                start = HEADER_SIZE + 8 * (base + self._offsets[i] + offset * self._slots[i])
+                nbytes = arrays[k].nbytes
+                self._mmap[start:start + nbytes] = bytes(nbytes) if v is None else arrays[k].encode(v)
+            else:
+                values[base + self._offsets[i] + offset] = math.nan if v is None else v
+        self.rows = n + 1
+
+    def flush(self):
+        """Makes appended rows durable: data pages are synced before committed row counter"""
+        self._mmap.flush()
+        struct.pack_into('<Q', self._mmap, 8, self.rows)
+        self._mmap.flush(0, HEADER_SIZE)
+
+    def column(self, name, first=0, last=None):
+        """:return: list of values of column for rows first..last-1, NaN is None, arrays are array.array"""
+        last = self.rows if last is None else min(last, self.rows)
+        i = self._index[name]
+        if name in self.arrays:
+            return self._array_column(i, self.arrays[name], first, last)
+        result = []
+        n = first
+        while n < last:
+            chunk, offset = divmod(n, self.chunk_rows)
+            count = min(self.chunk_rows - offset, last - n)
+            base = chunk * self._chunk_size + self._offsets[i] + offset
+            result.extend(self._values[base:base + count].tolist())
+            n += count
+        return [None if v != v else v for v in result]
+
+    def _array_column(self, i, spec, first, last):
+        result = []
+        for n in range(first, last):
+            chunk, offset = divmod(n, self.chunk_rows)
+            start = HEADER_SIZE + 8 * (chunk * self._chunk_size + self._offsets[i] + offset * self._slots[i])
+            result.append(spec.decode(self._mmap[start:start + spec.nbytes]))
+        return result
+
+    def read_rows(self, first=0, last=None, columns=None):
+        """Yields rows as dictionaries"""
+        columns = self.columns if columns is None else columns
+        data = [self.column(k, first, last) for k in columns]
+        for values in zip(*data):
+            yield dict(zip(columns, values))
+
+    def close(self):
+        if self.writable:
+            self.flush()
+            # file is cut after the last row, capacity is added again when appending continues
+            size = HEADER_SIZE + ((self.rows + self.chunk_rows - 1) // self.chunk_rows) * self._chunk_size * 8
+            self._unmap()
+            self._file.truncate(size)
+        else:
+            self._unmap()
+        self._file.close()
+
+
+class ColumnarLogUpdater(DBUpdater):
+    """
+    DBUpdater writing states to ColumnarLog instead of database,
+    add stores row in mapped memory, commit makes rows durable.
+    Log can be imported into database table by load_columnar_log (database_updater.py).
+    """
+
+    def __init__(self, login, password, database, host='localhost', table=DatabaseUpdaterSimulator.StateSimulator,
+                 chunk_rows=4096):
+        """
+        :param database: path of log file, existing file is replaced
+        :param table: class with COLUMNS, e.g. State, columns are stored in sorted order
+        :param chunk_rows: rows in one chunk of log file
+        login, password and host are not used, they are kept for get_db_dict
+        """
+        self.table = table
+        self.login = login
+        self.password = password
+        self.database = database
+        self.host = host
+        self.chunk_rows = chunk_rows
+        self.log = ColumnarLog(database, sorted(table.COLUMNS), chunk_rows, table_arrays(table))
+        logger.info('Writing states to %s', database)
+
+    def get_db_dict(self):
+        d = super(ColumnarLogUpdater, self).get_db_dict()
+        d["chunk_rows"] = self.chunk_rows
+        return d
+
+    def add(self, row):
+        self.log.append(row)
+
+    def commit(self):
+        self.log.flush()
+
+    def close(self):
+        self.log.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Columnar log of simulation states")
+    parser.add_argument('command', choices=['info', 'dump', 'load'],
+                        help='info - columns and rows, dump - rows as JSON lines, load - import into database')
+    parser.add_argument('path', help='log file')
+    parser.add_argument('-d', '--database', dest='database', help='database of load')
+    parser.add_argument('-u', '--login', dest='login', default='root')
+    parser.add_argument('-H', '--host', dest='host', default='localhost')
+    parser.add_argument('--dialect', dest='dialect', default='mysql+mysqlconnector',
+                        help='SQLAlchemy dialect, sqlite takes database file path as database')
+    parser.add_argument('--batch', dest='batch', type=int, default=5000, help='rows inserted at once')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.command == 'load':
+        from database_updater import load_columnar_log
+        password = '' if args.dialect.startswith('sqlite') else getpass.getpass()
+        n = load_columnar_log(args.path, args.login, password, args.database or 'luki_testing', args.host,
+                              dialect=args.dialect, batch_size=args.batch)
+        print('Loaded %d rows' % n)
+    else:
+        log = ColumnarLog(args.path)
+        try:
+            if args.command == 'info':
+                print(json.dumps({"columns": log.columns, "rows": log.rows, "chunk_rows": log.chunk_rows,
+                                  "arrays": {k: spec.declaration() for k, spec in log.arrays.items()}}))
+            else:
+                for row in log.read_rows():
+                    print(json.dumps(row, default=to_json))
+        finally:
+            log.close()
@@ -0,0 +1,94 @@
+import zlib
+
+from protocol import dumps, loads
+
+"""
+Compression of session messages negotiated in handshake:
+{"session": {..., "compression": {"method": "zlib", "threshold": 1024, "level": 1, "dictionary": true}}}
+Server agrees when protocol carries bytes and returns the same settings in "compression" of its response.
+Afterwards every message of the session (except stats) is sent as bytes starting with kind byte:
+RAW_JSON and RAW_BINARY carry JSON text and codec messages as they are,
+ZLIB_JSON and ZLIB_BINARY carry them compressed. Only payloads of at least threshold bytes
+are compressed and compressed payload is sent only when it is smaller.
+Preset dictionary (zdict) is built from names of schema, so even short messages
+refer to variable names instead of repeating them.
+"""
+
+RAW_JSON = 0
+RAW_BINARY = 1
+ZLIB_JSON = 2
+ZLIB_BINARY = 3
+
+
+def schema_dictionary(variables, time_name="time"):
+    """Preset dictionary of zlib: JSON fragments with names of variables, the most common ones last"""
+    names = ''.join('"%s": ' % k for k in variables)
+    return ('{"block": [{"history": {"variables": [null, "from": "to": '
+            + names + '{"data": {"request": ["%s": ' % time_name).encode('utf-8')
+
+
+class Compressor(object):
+    """Compresses and decompresses messages of one session"""
+    NAME = "zlib"
+
+    def __init__(self, threshold=1024, level=1, zdict=None):
+        """
+        :param threshold: payloads shorter than that many bytes are sent uncompressed
+        :param level: zlib compression level, 1 is the fastest
+        :param zdict: preset dictionary (see schema_dictionary), None - none
+        """
+        self.threshold = threshold
+        self.level = level
+        self.zdict = zdict
+
+    @classmethod
+    def negotiate(cls, settings, variables, time_name="time"):
+        """
+        :param settings: "compression" of handshake
+        :param variables: schema published in handshake response
+        :return: Compressor, None when method is not supported
+        """
+        if not isinstance(settings, dict) or settings.get("method", cls.NAME) != cls.NAME:
+            return None
+        zdict = schema_dictionary(variables, time_name) if settings.get("dictionary") else None
+        return cls(settings.get("threshold", 1024), settings.get("level", 1), zdict)
+
+    def settings(self):
+        """:return: "compression" of handshake"""
+        return {"method": self.NAME, "threshold": self.threshold, "level": self.level,
+                "dictionary": self.zdict is not None}
+
+    def compress(self, message):
+        """:return: bytes of message (python data structure or bytes of codec) with kind byte"""
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            kind, payload = RAW_BINARY, bytes(message)
+        else:
+            kind, payload = RAW_JSON, dumps(message).encode('utf-8')
+        if len(payload) >= self.threshold:
+            if self.zdict is None:
+                compressor = zlib.compressobj(self.level)
+            else:
+                compressor = zlib.compressobj(self.level, zdict=self.zdict)
+            compressed = compressor.compress(payload) + compressor.flush()
+            if len(compressed) < len(payload):
+                return bytes([kind + ZLIB_JSON]) + compressed
+        return bytes([kind]) + payload
+
+    def decompress(self, message):
+        """:return: python data structure or bytes of codec, messages which are not bytes are returned as they are"""
+        if not isinstance(message, (bytes, bytearray, memoryview)):
+            return message
+        kind = message[0]
+        payload = memoryview(message)[1:]
+        if kind >= ZLIB_JSON:
+            if self.zdict is None:
+                decompressor = zlib.decompressobj()
+            else:
+                decompressor = zlib.decompressobj(zdict=self.zdict)
+            payload = decompressor.decompress(payload) + decompressor.flush()
+            kind -= ZLIB_JSON
+        if kind == RAW_JSON:
+            return loads(payload)
+        if kind == RAW_BINARY:
+            return bytes(payload)
+        raise Exception('Unknown kind of compressed message: %d' % kind)
@@ -1,6 +1,12 @@
 import getpass
 import logging
+import queue
+import threading
+import time
 from database_updater_interface import DBUpdater
+from arrays import table_arrays
+from columnar_log import ColumnarLog
+from log_config import payload_sampled
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +22,11 @@ Base = declarative_base()
 
 
 class State(Base):
-    """ Class represents table in MySQL"""
+    """
+    Class represents table in MySQL
+    Tables with array variables declare them in ARRAYS (see arrays.py)
+    and store them in LargeBinary columns as raw little endian bytes
+    """
     __tablename__ = 'simulation_states'
 
     time = Column(Integer, primary_key=True)
@@ -53,11 +63,26 @@ class State(Base):
 
 
 
+def binary_arrays(row, arrays):
+    """Replaces arrays of row with their raw bytes, :param arrays: {name: ArrayVariable}"""
+    for k, spec in arrays.items():
+        v = row.get(k)
+        if v is not None:
+            row[k] = bytes(spec.encode(v))
+    return row
+
+
+def database_url(login, password, database, host='localhost', dialect='mysql+mysqlconnector'):
+    """SQLAlchemy url, for sqlite database is path of database file"""
+    if dialect.startswith('sqlite'):
+        return '{dialect}:///{base}'.format(dialect=dialect, base=database)
+    return '{dialect}://{login}:{password}@{host}/{base}' \
+        .format(dialect=dialect, login=login, base=database, password=password, host=host)
+
+
 class DatabaseUpdater(DBUpdater):
     def __init__(self, login, password, database, host='localhost', table=State):
-        engine = create_engine( \
-            'mysql+mysqlconnector://{login}:{password}@{host}/{base}' \
-                .format(login=login, base=database, password=password, host=host))
+        engine = create_engine(database_url(login, password, database, host))
 
         con = engine.connect()
         try:
@@ -70,6 +95,7 @@ class DatabaseUpdater(DBUpdater):
         Session = sessionmaker(bind=engine)
         self.session = Session()
         self.table = table
+        self.arrays = table_arrays(table)
         self.login = login
         self.password = password
         self.database = database
@@ -77,9 +103,10 @@ class DatabaseUpdater(DBUpdater):
 
     def add(self, row):
         """Adds row (i.e. State object) to table buffer (associated with State)"""
-        row = {k: v for k, v in row.items() if k in self.table.COLUMNS}
+        row = binary_arrays({k: v for k, v in row.items() if k in self.table.COLUMNS}, self.arrays)
         table_element = self.table(row)
-        logger.info('updating database with: {}'.format(table_element))
+        if payload_sampled(logger, row.get('time', 0)):
+            logger.debug('updating database with: %s', table_element)
         try:
             self.session.add(table_element)
         except Exception as e:
@@ -90,6 +117,134 @@ class DatabaseUpdater(DBUpdater):
         self.session.commit()
 
 
+class BatchedDatabaseUpdater(DBUpdater):
+    """
+    Writes rows from background thread, so add and commit do not wait for the database.
+    Rows are buffered in bounded queue (add blocks when it is full) and inserted
+    with one executemany per batch, transaction is committed every batch_size rows,
+    every flush_time seconds or when commit is called.
+    """
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(self, login, password, database, host='localhost', table=State,
+                 dialect='mysql+mysqlconnector', batch_size=500, flush_time=1.0, queue_size=10000):
+        """
+        :param dialect: SQLAlchemy dialect, 'sqlite' takes database file path as database
+        :param batch_size: number of rows which triggers insert and commit
+        :param flush_time: maximal time in seconds rows wait in buffer
+        :param queue_size: number of buffered rows after which add blocks
+        """
+        self.engine = create_engine(database_url(login, password, database, host, dialect))
+        table.__table__.drop(self.engine, checkfirst=True)
+        Base.metadata.create_all(self.engine)
+
+        self.table = table
+        self.login = login
+        self.password = password
+        self.database = database
+        self.host = host
+        self.dialect = dialect
+        self.batch_size = batch_size
+        self.flush_time = flush_time
+        self.queue_size = queue_size
+
+        self._columns = sorted(table.COLUMNS)
+        self._arrays = table_arrays(table)
+        self._insert = table.__table__.insert()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='BatchedDatabaseUpdater', daemon=True)
+        self._thread.start()
+
+    def get_db_dict(self):
+        d = super(BatchedDatabaseUpdater, self).get_db_dict()
+        d.update({"dialect": self.dialect, "batch_size": self.batch_size,
+                  "flush_time": self.flush_time, "queue_size": self.queue_size})
+        return d
+
+    def add(self, row):
+        """Puts row into buffer, blocks while buffer is full"""
+        if self._error is not None:
+            raise self._error
+        self._queue.put(binary_arrays({k: row.get(k) for k in self._columns}, self._arrays))
+
+    def commit(self):
+        """Asks writer to insert and commit buffered rows, does not wait for it"""
+        if self._error is not None:
+            raise self._error
+        self._queue.put(self._FLUSH)
+
+    def close(self):
+        """Writes remaining rows and stops writer thread"""
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self.engine.dispose()
+
+    def _write(self, rows):
+        if not rows:
+            return
+        with self.engine.begin() as con:
+            con.execute(self._insert, rows)
+        logger.info('Inserted %d rows', len(rows))
+        del rows[:]
+
+    def _run(self):
+        rows = []
+        deadline = time.time() + self.flush_time
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    item = self._FLUSH
+                if item is self._STOP:
+                    self._write(rows)
+                    return
+                if item is not self._FLUSH:
+                    rows.append(item)
+                if item is self._FLUSH or len(rows) >= self.batch_size or time.time() >= deadline:
+                    self._write(rows)
+                    deadline = time.time() + self.flush_time
+        except Exception as e:
+            logger.error('Database writer stopped: %s', e)
+            self._error = e
+            # unblock producers waiting on full queue
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+
+def load_columnar_log(path, login, password, database, host='localhost', table=State,
+                      dialect='mysql+mysqlconnector', batch_size=5000):
+    """
+    Imports finished ColumnarLog into table, table is recreated like by DatabaseUpdater
+    :param path: log file written by ColumnarLogUpdater
+    :param batch_size: rows inserted by one executemany
+    :return: number of imported rows
+    """
+    engine = create_engine(database_url(login, password, database, host, dialect))
+    table.__table__.drop(engine, checkfirst=True)
+    Base.metadata.create_all(engine)
+    log = ColumnarLog(path)
+    insert = table.__table__.insert()
+    columns = [k for k in log.columns if k in table.COLUMNS]
+    try:
+        for first in range(0, log.rows, batch_size):
+            rows = list(log.read_rows(first, first + batch_size, columns))
+            for row in rows:
+                row['time'] = int(row['time'])
+                binary_arrays(row, log.arrays)
+            with engine.begin() as con:
+                con.execute(insert, rows)
+            logger.info('Loaded rows %d-%d of %s', first, first + len(rows) - 1, path)
+    finally:
+        log.close()
+        engine.dispose()
+    return log.rows
+
 
 if __name__ == '__main__':
     password = getpass.getpass()
@@ -13,4 +13,8 @@ class DBUpdater(metaclass=ABCMeta):
         """Allows for recreation"""
         d = {k:v for k,v in db_dict.items() if k!='class'}
         db_updater = db_dict["class"](**d)
-        return db_updater
\ No newline at end of file
+        return db_updater
+
+    def close(self):
+        """Sends buffered data to database and releases resources"""
+        self.commit()
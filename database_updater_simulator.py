@@ -1,5 +1,6 @@
 import logging
 from database_updater_interface import DBUpdater
+from log_config import payload_sampled
 
 logger = logging.getLogger(__name__)
 
@@ -10,6 +11,7 @@ class DatabaseUpdaterSimulator(DBUpdater):
     class StateSimulator(object):
 
         COLUMNS = {'time', 'Tzm', 'Fzm', 'To', 'Tpco', 'Fzco', 'Tpm', 'Tzco', 'Tr'}
+        ARRAYS = {} # array variables among COLUMNS: {name: (typecode, shape)}, see arrays.py
 
         def __init__(self, state_dict):
             for k, v in state_dict.items():
@@ -25,7 +27,8 @@ class DatabaseUpdaterSimulator(DBUpdater):
         self.host = host
 
     def add(self, row):
-        logger.info("Adding {} to buffer".format(row))
+        if payload_sampled(logger, row.get('time', 0)):
+            logger.debug("Adding %s to buffer", row)
 
     def commit(self):
         logger.info("Commiting data to database")
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+Delta encoding of session exchanges.
+Both ends remember the last value of every variable sent in one direction,
+only values which changed since then are transmitted.
+"""
+
+_MISSING = object()
+
+
+def _snapshot(v):
+    """Value remembered by encoder, arrays (see arrays.py) are copied as bytes, so changes in place are noticed"""
+    if v is None or isinstance(v, (int, float, str)):
+        return v
+    try:
+        return bytes(memoryview(v))
+    except TypeError:
+        return v
+
+
+class DeltaEncoder(object):
+    """Sending end: remembers values already known to the peer"""
+
+    def __init__(self):
+        self.values = {}
+
+    def encode(self, data, keep=()):
+        """
+        :param data: full dictionary of values
+        :param keep: names always sent (e.g. time)
+        :return: values which differ from the previously sent ones
+        """
+        last = self.values
+        delta = {}
+        for k, v in data.items():
+            value = _snapshot(v)
+            if k in keep or last.get(k, _MISSING) != value:
+                delta[k] = v
+                last[k] = value
+        return delta
+
+
+class DeltaDecoder(object):
+    """Receiving end: fills values missing in delta with the last received ones"""
+
+    def __init__(self):
+        self.values = {}
+
+    def decode(self, delta, names=None):
+        """
+        :param delta: changed values
+        :param names: names of returned values, all ever received if None
+        :return: full dictionary of values
+        """
+        values = self.values
+        values.update(delta)
+        if names is None:
+            return dict(values)
+        return {k: values[k] for k in names if k in values}
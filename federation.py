@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import time
+
+from async_server import AsyncServer
+from protocol import ConfirmationProtocolManager
+from session import ServerSession
+from transport import parse_address
+
+logger = logging.getLogger(__name__)
+
+
+class Federation(object):
+    """
+    Server nodes sharing one simulation, every node owns subset of state variables.
+    Read from JSON file:
+    {"nodes": {"A": {"address": "unix:/tmp/a.sock", "variables": [owned variables],
+                     "imports": [variables of other nodes requested by clients of A]}, ...}}
+    Nodes are coupled when one of them imports variables of the other,
+    every node connects to nodes importing its variables (see FederatedServer.link).
+    """
+
+    def __init__(self, nodes):
+        """:param nodes: dictionary of node configurations described above"""
+        self.nodes = nodes
+        self.owners = {}
+        for node, config in nodes.items():
+            for k in config.get("variables", []):
+                if k in self.owners:
+                    raise Exception('Variable %s is owned by nodes %s and %s' % (k, self.owners[k], node))
+                self.owners[k] = node
+        for node, config in nodes.items():
+            for k in config.get("imports", []):
+                owner = self.owners.get(k)
+                if owner is None or owner == node:
+                    raise Exception('Variable %s imported by node %s is not owned by other node' % (k, node))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f)["nodes"])
+
+    def address(self, node):
+        return self.nodes[node]["address"]
+
+    def names(self, node):
+        """State variables of node: owned and imported ones"""
+        config = self.nodes[node]
+        return sorted(set(config.get("variables", [])) | set(config.get("imports", [])))
+
+    def exports(self, node, peer):
+        """Variables owned by node and imported by peer"""
+        return sorted(k for k in self.nodes[peer].get("imports", []) if self.owners[k] == node)
+
+    def coupled(self, node):
+        """Nodes exchanging variables with node"""
+        return sorted(peer for peer in self.nodes
+                      if peer != node and (self.exports(node, peer) or self.exports(peer, node)))
+
+    def links(self, node):
+        """Nodes importing variables of node, node connects to them and pushes the variables"""
+        return [peer for peer in self.coupled(node) if self.exports(node, peer)]
+
+    def sources(self, node):
+        """Nodes exporting variables to node, their links take part in every step of node"""
+        return [peer for peer in self.coupled(node) if self.exports(peer, node)]
+
+    def owners_of(self, names):
+        """Nodes owning given variables, unknown variables are skipped"""
+        return {self.owners[k] for k in names if k in self.owners}
+
+
+class FederatedServer(AsyncServer):
+    """
+    Node of federation (see Federation): AsyncServer whose default simulation
+    holds only variables owned by the node and variables it imports.
+    Local barrier waits for local clients and one link per node exporting variables to it,
+    so steps and cross-node traffic depend on coupling of nodes, not on number of all clients.
+    Link carries one message per step in one direction: node pushes variables imported by peer
+    as soon as its clients have sent them, peer puts them into its step on arrival without reply,
+    so no node waits for completion of steps of other nodes. Node importing nothing
+    may run ahead of its peers, they buffer pushed steps until their clients catch up.
+    Sessions of clients sending variables of other node are redirected there.
+    Nodes do not survive restart of a coupled node, whole federation has to be restarted.
+    """
+    COUNTERS = AsyncServer.COUNTERS + ['forwarded', 'redirected']
+    PHASES = AsyncServer.PHASES + ['link'] # sending values of one step over link
+
+    def __init__(self, federation, node, db_updater, db_update_time=1, protocol=ConfirmationProtocolManager(),
+                 stats_interval=None, history=1000, buffer_size=None):
+        """
+        :param federation: Federation
+        :param node: name of this node, it listens on address of node
+        :param db_updater: DatabaseUpdater writing rows of variables of this node
+        other parameters are described in AsyncServer
+        """
+        if node not in federation.nodes:
+            raise Exception('Unknown node: %s, available: %s' % (node, ', '.join(sorted(federation.nodes))))
+        self.federation = federation
+        self.node = node
+        address = federation.address(node)
+        super(FederatedServer, self).__init__(address, None, db_updater, db_update_time, protocol,
+                                              stats_interval=stats_interval, history=history, buffer_size=buffer_size)
+        if self.transport.port != parse_address(address).port:
+            self.sock.close()
+            raise Exception('Node %s can not listen on %s' % (node, address))
+        self.names = federation.names(node)
+        self.links = len(federation.sources(node))
+
+    def redirect(self, message):
+        hello = message[ServerSession.SESSION] or {}
+        peer = hello.get(ServerSession.NODE)
+        if peer is not None:
+            if peer not in self.federation.sources(self.node):
+                return {ServerSession.ERROR: 'Node %s exports no variables to %s' % (peer, self.node)}
+            return None
+        if ServerSession.simulation_name(message) != ServerSession.DEFAULT_SIMULATION:
+            return {ServerSession.ERROR: 'Named simulations are not federated'}
+        owners = self.federation.owners_of(hello.get(ServerSession.DATA) or [])
+        if not owners or owners == {self.node}:
+            return None
+        if len(owners) > 1:
+            return {ServerSession.ERROR: 'Data of session is owned by nodes %s' % ', '.join(sorted(owners))}
+        node = owners.pop()
+        self.metrics.add('redirected')
+        return {ServerSession.REDIRECT: self.federation.address(node), ServerSession.NODE: node}
+
+    async def connect(self, peer):
+        """Connects to peer node, waits until it is started"""
+        transport = parse_address(self.federation.address(peer))
+        loop = asyncio.get_running_loop()
+        waiting = False
+        while True:
+            try:
+                sock = await loop.run_in_executor(None, transport.connect)
+                break
+            except OSError:
+                if not waiting:
+                    logger.info('Waiting for node %s at %s', peer, transport.address)
+                    waiting = True
+                await asyncio.sleep(0.1)
+        return await asyncio.open_connection(sock=sock, limit=2 ** 24)
+
+    async def link(self, simulation, peer):
+        """
+        Pushes variables of this node imported by peer: values of every step are sent
+        as soon as clients here have sent them, peer receives them in stream
+        """
+        exports = self.federation.exports(self.node, peer)
+        queue = simulation.forward(exports)
+        reader, writer = await self.connect(peer)
+        try:
+            hello = {"name": "node %s" % self.node, ServerSession.NODE: self.node,
+                     ServerSession.DATA: exports, ServerSession.REQUEST: []}
+            await self.protocol.send_async(reader, writer, {ServerSession.SESSION: hello})
+            response = await self.protocol.receive_async(reader, writer)
+            if ServerSession.ERROR in response:
+                raise Exception(response[ServerSession.ERROR])
+            logger.info('Linked with node %s, sending: %s', peer, exports)
+            while True:
+                step, values = await queue.get()
+                t = time.perf_counter()
+                await self.protocol.send_async(reader, writer, {self.TIME: step, ServerSession.DATA: values})
+                self.metrics.observe('link', time.perf_counter() - t)
+                self.metrics.add('forwarded', len(values))
+        except Exception as e:
+            logger.error('Link with node %s failed: %s', peer, e)
+            raise
+        finally:
+            writer.close()
+
+    async def stream(self, simulation, session, reader, writer):
+        """Puts values pushed by link of other node into steps of simulation as they arrive"""
+        logger.info('Node %s linked, receiving: %s', session.node, sorted(session.data))
+        while True:
+            try:
+                message = await self.protocol.receive_async(reader, writer)
+            except ConnectionError:
+                logger.error('Link of node %s closed', session.node)
+                return
+            values = message[ServerSession.DATA]
+            simulation.put(message[self.TIME], values)
+            self.metrics.add('forwarded', len(values))
+
+    async def serve(self):
+        simulation = self.simulation(ServerSession.DEFAULT_SIMULATION)
+        for peer in self.federation.links(self.node):
+            task = asyncio.ensure_future(self.link(simulation, peer))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        logger.info('Node %s with variables %s', self.node, self.names)
+        await super(FederatedServer, self).serve()
@@ -0,0 +1,98 @@
+import array
+import math
+import multiprocessing
+
+from barrier import _Value
+
+
+class StateHistory(object):
+    """
+    Last capacity complete states kept in memory, column by column.
+    Step of time t lives in slot t % capacity of every column, so appending
+    and finding a step costs O(1) and range of steps is read as slices of columns.
+    With multiprocessing context columns live in shared memory: manager appends,
+    serving processes answer queries. Slot is marked invalid while it is being
+    overwritten, readers check its time after copying.
+    None is kept as NaN.
+    """
+    INVALID = -1
+
+    def __init__(self, variables, capacity=1000, ctx=multiprocessing):
+        """
+        :param variables: names of stored variables
+        :param capacity: number of kept steps
+        :param ctx: multiprocessing (context) when readers are other processes, None otherwise
+        """
+        if capacity < 1:
+            raise Exception('History capacity has to be positive: %d' % capacity)
+        self.variables = list(variables)
+        self.capacity = capacity
+        self._index = {k: i for i, k in enumerate(self.variables)}
+        n = len(self.variables) * capacity
+        if ctx is not None and hasattr(ctx, 'RawArray'):
+            self._times = ctx.RawArray('q', [self.INVALID] * capacity)
+            self._values = ctx.RawArray('d', n)
+            self._last = ctx.RawValue('q', self.INVALID)
+        else:
+            self._times = array.array('q', [self.INVALID] * capacity)
+            self._values = array.array('d', bytes(8 * n))
+            self._last = _Value(self.INVALID)
+
+    @property
+    def last(self):
+        """Time of the newest step, -1 when history is empty"""
+        return self._last.value
+
+    def append(self, time, row):
+        """
+        Stores complete state of step
+        :param time: step number, consecutive steps have to be appended in order
+        :param row: dictionary with values of variables
+        """
+        slot = time % self.capacity
+        values = self._values
+        self._times[slot] = self.INVALID
+        for k, i in self._index.items():
+            v = row.get(k)
+            values[i * self.capacity + slot] = math.nan if v is None else v
+        self._times[slot] = time
+        self._last.value = time
+
+    def _slices(self, column, first, last):
+        """Values of column for steps first..last (inclusive), which are all in the buffer"""
+        base = column * self.capacity
+        a, b = first % self.capacity, last % self.capacity
+        if a <= b:
+            return list(self._values[base + a:base + b + 1])
+        return list(self._values[base + a:base + self.capacity]) + list(self._values[base:base + b + 1])
+
+    def query(self, names=None, first=None, last=None):
+        """
+        Values of variables between steps first and last (inclusive),
+        range is clipped to steps still kept in memory
+        :param names: variables, all when None
+        :param first: first step, the oldest kept when None
+        :param last: last step, the newest when None
+        :return: {"time": [steps], name: [values]}, missing values are None
+        """
+        names = self.variables if names is None else list(names)
+        unknown = [k for k in names if k not in self._index]
+        if unknown:
+            raise Exception('Unknown variables: %s' % ', '.join(unknown))
+        newest = self._last.value
+        oldest = max(newest - self.capacity + 1, 0)
+        first = oldest if first is None else max(first, oldest)
+        last = newest if last is None else min(last, newest)
+        result = {"time": []}
+        for k in names:
+            result[k] = []
+        if newest == self.INVALID or first > last:
+            return result
+        columns = {k: self._slices(self._index[k], first, last) for k in names}
+        times = range(first, last + 1)
+        # steps overwritten while they were copied are dropped
+        valid = [j for j, t in enumerate(times) if self._times[t % self.capacity] == t]
+        result["time"] = [times[j] for j in valid]
+        for k, column in columns.items():
+            result[k] = [None if column[j] != column[j] else column[j] for j in valid]
+        return result
@@ -0,0 +1,57 @@
+import atexit
+import logging
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+
+"""
+Logging of server hot paths:
+records may be passed through queue to background writer thread,
+so file writes do not delay exchanges, and dumps of exchanged data
+are written only for sampled steps and when DEBUG level is enabled.
+"""
+
+FORMAT = '%(levelname)s - %(asctime)s:\t%(message)s'
+
+_sample_every = 1
+
+
+def configure_logging(filename, level=logging.INFO, queued=True, sample_every=100, ctx=multiprocessing):
+    """
+    Configures root logger of the application
+    :param filename: log file
+    :param level: records below level are not formatted at all
+    :param queued: records are written by background thread of this process,
+                   processes forked later put their records into the same queue
+    :param sample_every: data of every n-th step is logged (see payload_sampled), 0 - never
+    :param ctx: multiprocessing when records come from forked processes, queue module otherwise
+    :return: QueueListener writing records, None when records are written synchronously
+    """
+    global _sample_every
+    _sample_every = sample_every
+
+    handler = logging.FileHandler(filename)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    root = logging.getLogger()
+    root.setLevel(level)
+    if not queued:
+        root.addHandler(handler)
+        return None
+    queue = ctx.Queue(-1)
+    root.addHandler(QueueHandler(queue))
+    listener = QueueListener(queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def payload_sampled(logger, step):
+    """
+    True when exchanged data of step should be logged:
+    DEBUG level is enabled for logger and step is sampled
+    """
+    return _sample_every > 0 and step % _sample_every == 0 and logger.isEnabledFor(logging.DEBUG)
+
+
+def sampled(step):
+    """True for steps whose progress is logged"""
+    return _sample_every > 0 and step % _sample_every == 0
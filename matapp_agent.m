@@ -0,0 +1,20 @@
+close all;
+clear all;
+% client_agent.py is started once and keeps connection with server,
+% every step empty line is sent to it and one line of JSON is read back
+pb = java.lang.ProcessBuilder({'python','client_agent.py','127.0.0.1','10000','apptest\out1','-r','Tr','Tzco','To','-f','apptest\client_1.input'});
+agent = pb.start();
+to_agent = java.io.PrintWriter(agent.getOutputStream(), true);
+from_agent = java.io.BufferedReader(java.io.InputStreamReader(agent.getInputStream()));
+for i=1:10
+    to_agent.println('');
+    result = char(from_agent.readLine());
+    data = loadjson(result);
+    if isfield(data,'error')
+        'blad klienta'
+    else
+        data
+    end
+end
+to_agent.println('quit');
+agent.waitFor();
@@ -0,0 +1,114 @@
+import json
+import logging
+import multiprocessing
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics(object):
+    """
+    Counters and latency histograms of server phases (receive, send, waiting for state, commit...).
+    Histograms have fixed buckets: bucket i counts durations shorter than 2**i microseconds,
+    so recording is a few additions and percentiles are known with precision of factor 2.
+    With multiprocessing context everything lives in shared arrays and every process
+    forked by the server records into the same histograms.
+    """
+    BUCKETS = 32 # the last one collects durations above 35 minutes
+
+    def __init__(self, phases, counters, ctx=multiprocessing):
+        """
+        :param phases: names of measured phases
+        :param counters: names of counters (also gauges, e.g. connected clients)
+        :param ctx: multiprocessing (context) when recording processes are forked, threading otherwise
+        """
+        self.phases = list(phases)
+        self.counters = list(counters)
+        self._phase_index = {k: i for i, k in enumerate(self.phases)}
+        self._counter_index = {k: len(self.phases) * (self.BUCKETS + 1) + i for i, k in enumerate(self.counters)}
+        size = len(self.phases) * (self.BUCKETS + 1) + len(self.counters)
+        if hasattr(ctx, 'RawArray'):
+            self._q = ctx.RawArray('q', size)                 # buckets and count of every phase, counters
+            self._d = ctx.RawArray('d', 2 * len(self.phases)) # sum and max of every phase
+        else:
+            self._q = [0] * size
+            self._d = [0.0] * (2 * len(self.phases))
+        self._lock = ctx.Lock()
+        self.started = time.time()
+
+    def observe(self, phase, seconds):
+        """Records duration of phase"""
+        i = self._phase_index[phase]
+        bucket = min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)
+        base = i * (self.BUCKETS + 1)
+        with self._lock:
+            self._q[base + bucket] += 1
+            self._q[base + self.BUCKETS] += 1
+            self._d[2 * i] += seconds
+            if seconds > self._d[2 * i + 1]:
+                self._d[2 * i + 1] = seconds
+
+    def add(self, counter, n=1):
+        with self._lock:
+            self._q[self._counter_index[counter]] += n
+
+    def counter(self, counter):
+        return self._q[self._counter_index[counter]]
+
+    def _percentile(self, buckets, count, q):
+        """Upper bound of bucket holding q-th percentile, in milliseconds"""
+        rank = q / 100.0 * count
+        seen = 0
+        for i, n in enumerate(buckets):
+            seen += n
+            if seen >= rank:
+                return 2 ** i / 1e3
+        return 2 ** (self.BUCKETS - 1) / 1e3
+
+    def snapshot(self):
+        """:return: JSON serializable copy of all metrics"""
+        with self._lock:
+            q = list(self._q)
+            d = list(self._d)
+        uptime = time.time() - self.started
+        result = {"uptime_s": uptime, "counters": {}, "phases": {}}
+        for k, i in self._counter_index.items():
+            result["counters"][k] = q[i]
+        for k, i in self._phase_index.items():
+            base = i * (self.BUCKETS + 1)
+            buckets = q[base:base + self.BUCKETS]
+            count = q[base + self.BUCKETS]
+            phase = {"count": count}
+            if count:
+                phase["mean_ms"] = d[2 * i] / count * 1e3
+                phase["max_ms"] = d[2 * i + 1] * 1e3
+                for p in (50, 95, 99):
+                    phase["p%d_ms" % p] = self._percentile(buckets, count, p)
+            result["phases"][k] = phase
+        if "steps" in self._counter_index and uptime > 0:
+            result["steps_per_s"] = result["counters"]["steps"] / uptime
+        return result
+
+
+def dump_periodically(metrics, interval, stop=None):
+    """
+    Logs snapshot of metrics as JSON every interval seconds, along with step rate of last interval
+    :param stop: threading.Event ending the loop
+    """
+    stop = stop if stop is not None else threading.Event()
+    steps = metrics.counter("steps")
+    while not stop.wait(interval):
+        snapshot = metrics.snapshot()
+        snapshot["recent_steps_per_s"] = (snapshot["counters"]["steps"] - steps) / interval
+        steps = snapshot["counters"]["steps"]
+        logger.info('stats %s', json.dumps(snapshot))
+
+
+def start_dumping(metrics, interval):
+    """Runs dump_periodically in daemon thread, interval None or 0 disables dumping"""
+    if not interval:
+        return None
+    thread = threading.Thread(target=dump_periodically, args=(metrics, interval), daemon=True)
+    thread.start()
+    return thread
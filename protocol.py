@@ -1,8 +1,100 @@
+import asyncio
 import json
 import logging
+import struct
+import weakref
+import zlib
+from collections import deque
+
+from arrays import to_json
 
 logger = logging.getLogger(__name__)
 
+
+class ConnectionClosed(ConnectionError):
+    """Raised when peer closes connection before whole message is received"""
+
+
+class ProtocolError(Exception):
+    """Raised when received frame is lost, duplicated or corrupted"""
+
+
+async def read_exactly(reader, n):
+    """Reads n bytes from asyncio stream, closed stream raises ConnectionClosed"""
+    try:
+        return await reader.readexactly(n)
+    except asyncio.IncompleteReadError as e:
+        raise ConnectionClosed('Connection closed after %d of %d bytes' % (len(e.partial), n))
+
+
+class ReceiveBuffer(object):
+    """
+    Reusable receive buffer of one connection.
+    Messages are received into it with recv_into and decoded from its views,
+    it grows only when message does not fit and keeps its size for next messages.
+    """
+
+    def __init__(self, size=4096):
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+
+    def reserve(self, n, keep=0):
+        """
+        Makes room for n bytes
+        :param keep: number of already received bytes copied to grown buffer
+        """
+        if n > len(self.data):
+            data = bytearray(max(n, 2 * len(self.data)))
+            data[:keep] = self.view[:keep]
+            self.data = data
+            self.view = memoryview(data)
+
+    def recv_exactly(self, connection, n, chunk_size=65536):
+        """
+        Reads exactly n bytes
+        :return: view of received bytes, valid until the next receive from connection
+        """
+        self.reserve(n)
+        view = self.view
+        pos = 0
+        while pos < n:
+            received = connection.recv_into(view[pos:n], min(n - pos, chunk_size))
+            if received == 0:
+                raise ConnectionClosed('Connection closed after %d of %d bytes' % (pos, n))
+            pos += received
+        return view[:n]
+
+
+class ReceiveBuffers(object):
+    """ReceiveBuffer of every connection, buffers are not copied when protocol is passed to another process"""
+
+    def __init__(self):
+        self._buffers = weakref.WeakKeyDictionary()
+
+    def __reduce__(self):
+        return ReceiveBuffers, ()
+
+    def get(self, connection):
+        """Returns buffer of connection, creates it for new connection"""
+        buffer = self._buffers.get(connection)
+        if buffer is None:
+            buffer = self._buffers[connection] = ReceiveBuffer()
+        return buffer
+
+    def pop(self, connection):
+        self._buffers.pop(connection, None)
+
+
+def dumps(data_structure):
+    """JSON text of message, arrays (see arrays.py) are written as lists"""
+    return json.dumps(data_structure, default=to_json)
+
+
+def loads(payload):
+    """Decodes JSON from bytes or view of receive buffer, text is decoded once without copying bytes"""
+    return json.loads(str(payload, "utf-8"))
+
+
 class ConfirmationProtocolManager(object):
 
     def __init__(self, eom='ł', cb=b'y'):
@@ -11,9 +103,11 @@ class ConfirmationProtocolManager(object):
         :param eom: end of message string
         :param cb: confirmation byte
         """
-        self.eom_byte_len = len(eom.encode("utf-8"))
+        self.eom_bytes = eom.encode("utf-8")
+        self.eom_byte_len = len(self.eom_bytes)
         self.eom = eom
         self.cb = cb
+        self._buffers = ReceiveBuffers()
 
     def receive(self, connection):
         """
@@ -21,38 +115,316 @@ class ConfirmationProtocolManager(object):
         bytes -> string -> python data structure
         received bytes should be encoded with utf-8
         string should be in json format
+        Message is received into reusable buffer of connection with as few reads as possible,
+        peer sends nothing after eom until confirmation, so data never follows eom in buffer.
         """
-        whole_message = b""
+        buffer = self._buffers.get(connection)
+        eom = self.eom_bytes
+        pos = 0
         while True:
-            data = connection.recv(16)
-            whole_message = whole_message + data
-            try:
-                # in case whole_message contains only one byte
-                # do not decode data because one char may be send in two packets
-                # decoding will raise exception
-                last_sign = whole_message[-self.eom_byte_len:].decode("utf-8")
-            except Exception as e:
-                logger.error(e)
-                continue
-            if last_sign[-len(self.eom):] == self.eom:
-                whole_message = whole_message.decode("utf-8")
-                whole_message = whole_message[:-len(self.eom)]
-                connection.send(self.cb)   #confirmation
-                data = json.loads(whole_message)
-                return data
+            if pos == len(buffer.data):
+                buffer.reserve(pos + 1, keep=pos)
+            received = connection.recv_into(buffer.view[pos:])
+            if received == 0:
+                raise ConnectionClosed('Connection closed before end of message')
+            pos += received
+            # eom bytes can not be the tail of other utf-8 character
+            if buffer.data.endswith(eom, 0, pos):
+                connection.sendall(self.cb)   #confirmation
+                return loads(buffer.view[:pos - self.eom_byte_len])
 
     def send(self, sock, data_structure):
         """
         Sends data stucture with eom end of message,
         waits for confirmation byte
         """
-        data_to_send = json.dumps(data_structure) + self.eom
+        data_to_send = dumps(data_structure) + self.eom
         data_to_send_utf = data_to_send.encode("utf-8")
-        sock.send(data_to_send_utf)
+        sock.sendall(data_to_send_utf)
         b = sock.recv(1)
         if b != self.cb:
             raise Exception('Confirmation byte is incorrect')
 
+    def detach(self, connection):
+        """Protocol keeps no state of connection, it may be passed to another process as it is"""
+        self._buffers.pop(connection)
+        return None
+
+    def attach(self, connection, state):
+        pass
+
+    async def receive_async(self, reader, writer):
+        """receive for asyncio streams"""
+        try:
+            whole_message = await reader.readuntil(self.eom_bytes)
+        except asyncio.IncompleteReadError:
+            raise ConnectionClosed('Connection closed before end of message')
+        writer.write(self.cb)   #confirmation
+        return loads(memoryview(whole_message)[:-self.eom_byte_len])
+
+    async def send_async(self, reader, writer, data_structure):
+        """send for asyncio streams"""
+        writer.write((dumps(data_structure) + self.eom).encode("utf-8"))
+        await writer.drain()
+        if await read_exactly(reader, 1) != self.cb:
+            raise Exception('Confirmation byte is incorrect')
+
+
+class LengthPrefixedProtocolManager(object):
+    """
+    Frames every message with fixed size header:
+    payload length (4 bytes, network order) and message type (1 byte).
+    Payload is read with few large reads into reusable buffer of connection,
+    so its content is never scanned and may contain any bytes.
+    """
+    HEADER = struct.Struct('!IB')
+    JSON = 1
+    BINARY = 2
+
+    def __init__(self, cb=b'y', confirm=True, chunk_size=65536):
+        """
+        Creates protocol manager
+        :param cb: confirmation byte
+        :param confirm: if set, send waits for confirmation byte like ConfirmationProtocolManager
+        :param chunk_size: maximal number of bytes requested by single recv
+        """
+        self.cb = cb
+        self.confirm = confirm
+        self.chunk_size = chunk_size
+        self._buffers = ReceiveBuffers()
+
+    def _recv_exactly(self, connection, n):
+        """Reads exactly n bytes into buffer of connection, returned view is valid until the next read"""
+        return self._buffers.get(connection).recv_exactly(connection, n, self.chunk_size)
+
+    def payload(self, data_structure):
+        """
+        Returns message type and payload
+        bytes-like objects are sent as BINARY messages, other python data structures as JSON
+        """
+        if isinstance(data_structure, (bytes, bytearray, memoryview)):
+            return self.BINARY, bytes(data_structure)
+        return self.JSON, dumps(data_structure).encode("utf-8")
+
+    def encode(self, data_structure):
+        """Builds whole frame"""
+        msg_type, payload = self.payload(data_structure)
+        return self.HEADER.pack(len(payload), msg_type) + payload
+
+    def decode(self, msg_type, payload):
+        """Converts payload to python data structure according to message type"""
+        if msg_type == self.JSON:
+            return loads(payload)
+        elif msg_type == self.BINARY:
+            return bytes(payload)
+        raise Exception('Unknown message type: %d' % msg_type)
+
+    def receive(self, connection):
+        """
+        Downloads header and then whole payload
+        JSON messages are returned as python data structures, BINARY messages as bytes
+        """
+        length, msg_type = self.HEADER.unpack(self._recv_exactly(connection, self.HEADER.size))
+        payload = self._recv_exactly(connection, length)
+        if self.confirm:
+            connection.sendall(self.cb)   #confirmation
+        return self.decode(msg_type, payload)
+
+    def send(self, sock, data_structure):
+        """
+        Sends framed data structure,
+        waits for confirmation byte if confirm is set
+        """
+        sock.sendall(self.encode(data_structure))
+        if self.confirm:
+            b = sock.recv(1)
+            if b != self.cb:
+                raise Exception('Confirmation byte is incorrect')
+
+    def detach(self, connection):
+        """Protocol keeps no state of connection, it may be passed to another process as it is"""
+        self._buffers.pop(connection)
+        return None
+
+    def attach(self, connection, state):
+        pass
+
+    async def receive_async(self, reader, writer):
+        """receive for asyncio streams"""
+        length, msg_type = self.HEADER.unpack(await read_exactly(reader, self.HEADER.size))
+        payload = await read_exactly(reader, length)
+        if self.confirm:
+            writer.write(self.cb)   #confirmation
+        return self.decode(msg_type, payload)
+
+    async def send_async(self, reader, writer, data_structure):
+        """send for asyncio streams"""
+        writer.write(self.encode(data_structure))
+        await writer.drain()
+        if self.confirm and await read_exactly(reader, 1) != self.cb:
+            raise Exception('Confirmation byte is incorrect')
+
+
+class PipelinedProtocolManager(LengthPrefixedProtocolManager):
+    """
+    Length prefixed framing with sequence numbers and cumulative acknowledgements.
+    Every frame carries its sequence number, number of frames received so far from the peer
+    (piggybacked acknowledgement) and crc32 of payload. Sender blocks only when window
+    of unacknowledged frames is full, receiver sends separate ACK frame after ack_every
+    frames which could not be acknowledged by its own messages.
+    State of both directions is kept per connection, received messages
+    are decoded before they are queued, so frames are read into reusable buffer.
+    """
+    HEADER = struct.Struct('!IBIII')  # length, type, seq, ack, crc32
+    ACK = 3
+    SEQ_MASK = 0xFFFFFFFF
+
+    class Channel(object):
+        """Sequence numbers and frames received ahead of time for one connection"""
+
+        def __init__(self):
+            self.send_seq = 0   # sequence number of next frame to send
+            self.recv_seq = 0   # sequence number of next expected frame
+            self.acked = 0      # frames acknowledged by peer
+            self.ack_sent = 0   # frames acknowledged to peer
+            self.pending = deque() # decoded messages
+
+    def __init__(self, window=8, ack_every=None, chunk_size=65536):
+        """
+        Creates protocol manager
+        :param window: maximal number of frames sent and not acknowledged yet
+        :param ack_every: number of received frames after which separate ACK frame is sent, defaults to half of window
+        :param chunk_size: maximal number of bytes requested by single recv
+        """
+        super(PipelinedProtocolManager, self).__init__(confirm=False, chunk_size=chunk_size)
+        if window < 1:
+            raise Exception('Window has to be positive')
+        self.window = window
+        self.ack_every = min(ack_every or max(window // 2, 1), window)
+        self._channels = weakref.WeakKeyDictionary()
+
+    def __getstate__(self):
+        """Connections are not shared between processes, so their state is not copied"""
+        state = self.__dict__.copy()
+        state['_channels'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._channels = weakref.WeakKeyDictionary()
+
+    def channel(self, connection):
+        """Returns state of given connection, creates it for new connection"""
+        ch = self._channels.get(connection)
+        if ch is None:
+            ch = self._channels[connection] = self.Channel()
+        return ch
+
+    def detach(self, connection):
+        """
+        Removes state of connection which is passed to another process
+        :return: picklable state for attach
+        """
+        self._buffers.pop(connection)
+        return self._channels.pop(connection, None)
+
+    def attach(self, connection, state):
+        """Continues connection served by another process so far"""
+        if state is not None:
+            self._channels[connection] = state
+
+    def in_flight(self, connection):
+        """Number of sent frames not acknowledged by peer"""
+        ch = self.channel(connection)
+        return (ch.send_seq - ch.acked) & self.SEQ_MASK
+
+    def _frame(self, ch, msg_type, payload):
+        header = self.HEADER.pack(len(payload), msg_type, ch.send_seq, ch.recv_seq, zlib.crc32(payload))
+        ch.ack_sent = ch.recv_seq
+        return header + payload
+
+    def _process_frame(self, ch, header, payload):
+        """
+        Processes acknowledgement carried by frame, data frames are queued in channel
+        :return: ACK frame which has to be sent to the peer or None
+        """
+        length, msg_type, seq, ack, crc = header
+        if (ack - ch.acked) & self.SEQ_MASK > (ch.send_seq - ch.acked) & self.SEQ_MASK:
+            raise ProtocolError('Acknowledged frame %d was never sent' % ack)
+        ch.acked = ack
+        if msg_type == self.ACK:
+            return None
+        if seq != ch.recv_seq:
+            raise ProtocolError('Expected frame %d, received %d' % (ch.recv_seq, seq))
+        if zlib.crc32(payload) != crc:
+            raise ProtocolError('Frame %d is corrupted' % seq)
+        ch.recv_seq = (ch.recv_seq + 1) & self.SEQ_MASK
+        ch.pending.append(self.decode(msg_type, payload))
+        if (ch.recv_seq - ch.ack_sent) & self.SEQ_MASK >= self.ack_every:
+            return self._frame(ch, self.ACK, b'')
+        return None
+
+    def _read_frame(self, connection, ch):
+        """Reads and processes one frame"""
+        header = self.HEADER.unpack(self._recv_exactly(connection, self.HEADER.size))
+        ack_frame = self._process_frame(ch, header, self._recv_exactly(connection, header[0]))
+        if ack_frame is not None:
+            connection.sendall(ack_frame)
+
+    async def _read_frame_async(self, reader, writer, ch):
+        header = self.HEADER.unpack(await read_exactly(reader, self.HEADER.size))
+        ack_frame = self._process_frame(ch, header, await read_exactly(reader, header[0]))
+        if ack_frame is not None:
+            writer.write(ack_frame)
+
+    def receive(self, connection):
+        """
+        Returns next message from the peer
+        JSON messages are returned as python data structures, BINARY messages as bytes
+        """
+        ch = self.channel(connection)
+        while not ch.pending:
+            self._read_frame(connection, ch)
+        return ch.pending.popleft()
+
+    def send(self, sock, data_structure):
+        """
+        Sends data structure without waiting for confirmation,
+        blocks only when window of unacknowledged frames is full
+        """
+        ch = self.channel(sock)
+        while self.in_flight(sock) >= self.window:
+            self._read_frame(sock, ch)
+        sock.sendall(self._frame(ch, *self.payload(data_structure)))
+        ch.send_seq = (ch.send_seq + 1) & self.SEQ_MASK
+
+    async def receive_async(self, reader, writer):
+        """receive for asyncio streams, connection state is kept per writer"""
+        ch = self.channel(writer)
+        while not ch.pending:
+            await self._read_frame_async(reader, writer, ch)
+        return ch.pending.popleft()
+
+    async def send_async(self, reader, writer, data_structure):
+        """send for asyncio streams, connection state is kept per writer"""
+        ch = self.channel(writer)
+        while self.in_flight(writer) >= self.window:
+            await self._read_frame_async(reader, writer, ch)
+        writer.write(self._frame(ch, *self.payload(data_structure)))
+        ch.send_seq = (ch.send_seq + 1) & self.SEQ_MASK
+        await writer.drain()
+
 
+PROTOCOLS = {
+    'confirmation': ConfirmationProtocolManager,
+    'length': LengthPrefixedProtocolManager,
+    'pipelined': PipelinedProtocolManager,
+}
 
 
+def get_protocol(name):
+    """Creates protocol manager registered in PROTOCOLS under given name"""
+    try:
+        return PROTOCOLS[name]()
+    except KeyError:
+        raise Exception('Unknown protocol: %s, available: %s' % (name, ', '.join(sorted(PROTOCOLS))))
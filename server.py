@@ -1,14 +1,28 @@
-import socket
 import time
 import argparse
 import logging
 import getpass
 import os
+import select
 import sys
-from multiprocessing import Process, Lock, Manager
+import warnings
+from multiprocessing import Process, Manager, active_children
+from multiprocessing.connection import wait
 
 from enum import Enum
-from protocol import ConfirmationProtocolManager
+from protocol import ConfirmationProtocolManager, PROTOCOLS, get_protocol
+from session import ServerSession
+from async_server import AsyncServer
+from session_server import ShardedServer
+from federation import Federation, FederatedServer
+from state_store import SharedStateStore
+from arrays import table_arrays
+from barrier import StepBarrier
+from history import StateHistory
+from columnar_log import ColumnarLogUpdater
+from metrics import Metrics, start_dumping
+from log_config import configure_logging, payload_sampled, sampled
+from transport import parse_address, write_endpoint
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +40,7 @@ class Mode(Enum):
 
 
 try:
-    from database_updater import DatabaseUpdater
+    from database_updater import DatabaseUpdater, BatchedDatabaseUpdater
     MODE = Mode.DEBUG
 except Exception as e:
     from database_updater_simulator import DatabaseUpdaterSimulator
@@ -37,175 +51,318 @@ except Exception as e:
     print("All database operation will be simulated by module DatabaseUpdaterSimulator",file=sys.stderr)
 
 
-logging.basicConfig(level=logging.DEBUG,filename='server.log',\
-                    format='%(levelname)s - %(asctime)s:\t%(message)s')
-
-
 class Server(object):
     """
     Server gathers state variables from client apps
     and it saves those variables in database. Clients
     send requests for variables to the server along with data
     in response appropriate data is sent.
+    Every connection is served by separate process: forked for it
+    or taken from pool of pre-forked workers accepting on shared listening socket.
     """
-    WAIT_FOR_N = "WAIT_FOR_N"
-    WAIT_TIME = "WAIT_TIME"
     TIME = "time"
     DB_UPDATE_TIME = "DB_UPDATE_TIME" #sek
-    CONFIG_STATES = {WAIT_FOR_N, WAIT_TIME, TIME, DB_UPDATE_TIME}
-
-    def __init__(self, ip, port, db_updater,db_update_time=1, wait_time=1e-5, protocol=ConfirmationProtocolManager()):
+    CONFIG_STATES = {TIME, DB_UPDATE_TIME}
+    # receive, send and steps of exchange (enter, update, wait, read) are measured by serving processes,
+    # waiting for full state (gather), for clients (drain) and database operations by manager
+    PHASES = ['receive', 'enter', 'update', 'wait', 'read', 'send', 'gather', 'drain', 'db_add', 'commit']
+    COUNTERS = ['steps', 'exchanges', 'connections', 'clients']
+    POOL_CHECK = 1.0 # seconds between checks of connections waiting for busy workers
+
+    def __init__(self, ip, port, db_updater,db_update_time=1, wait_time=None, protocol=ConfirmationProtocolManager(),\
+                 state_store='manager', stats_interval=None, history=1000, buffer_size=None,
+                 workers=None, max_exchanges=None):
         """
-        :param ip: phisical ip address of host machine
+        :param ip: phisical ip address of host machine or address of transport (e.g. unix:/tmp/server.sock)
         :param port: indicates where to start searching for free tcp/ip port
         :param db_updater: DatabaseUpdater (production mode), DatabaseUpdaterSimulator(sim mode)
+        :param wait_time: deprecated and ignored, serving processes wait on step barrier instead of polling state,
+                          kept so that protocol passed as positional argument is not taken as wait_time
         :param protocol: object with methods send and receive allows for python data structures exchange via tcp/ip
+        :param state_store: 'manager' - Manager().dict(), 'shared' - SharedStateStore in shared memory
+        :param stats_interval: seconds between metrics written to log, None - metrics are only sent on request
+        :param history: number of recent steps kept in shared memory for history requests, 0 - none
+        :param buffer_size: socket buffers in bytes, None - system defaults
+        :param workers: number of pre-forked worker processes, None - process is forked for every connection.
+                        Worker serves one connection at a time and steps wait for all clients,
+                        so pool has to be at least as large as number of clients connected at once
+        :param max_exchanges: worker is replaced by new one when it has served that many exchanges,
+                              limit is checked when its connection is closed, so worker serving session
+                              is replaced only after the session ends, None - never
         """
+        if wait_time is not None:
+            warnings.warn('wait_time of Server is ignored', DeprecationWarning, stacklevel=2)
         self.ip = ip
-        self.port = port
         self.protocol = protocol
-
-        self.sock = None
-        self.find_free_port()
-        # TCP/IT blocks port after closing it
-        # blocking time can last even 4 minutes
-
-        self._manager = Manager()
-        self.state = self._manager.dict() # state shared by many processes
-        self.initialize_state(db_updater.table.COLUMNS,wait_time,db_update_time)
+        self.workers = workers
+        self.max_exchanges = max_exchanges
+
+        self.transport = parse_address(ip, port, buffer_size)
+        self.sock = self.transport.listen(workers or 1)
+        self.port = self.transport.port
+        self.arrays = table_arrays(db_updater.table)
+
+        if state_store == 'shared':
+            names = [k for k in db_updater.table.COLUMNS if k not in self.CONFIG_STATES]
+            self.state = SharedStateStore(sorted(names), counters=[self.TIME],\
+                                          settings=[self.DB_UPDATE_TIME], step_counter=self.TIME, arrays=self.arrays)
+        elif state_store == 'manager':
+            self._manager = Manager()
+            self.state = self._manager.dict() # state shared by many processes
+        else:
+            raise Exception('Unknown state store: %s' % state_store)
+        self.initialize_state(db_updater.table.COLUMNS,db_update_time)
         # program can send data to database and reset it
         # when all data is gathered and serving processes do not need current state any more
 
         db_dict = db_updater.get_db_dict() # way of sending db_updater to separate process
 
-        self.enter_lock = Lock()
-        self.exit_lock = Lock()
+        self.barrier = StepBarrier()
+        names = [k for k in db_updater.table.COLUMNS if k not in self.CONFIG_STATES and k not in self.arrays]
+        self.history = StateHistory(sorted(names), history) if history else None # scalar variables
+        self.metrics = Metrics(self.PHASES, self.COUNTERS)
+        self.stats_interval = stats_interval
         self.db_updater = Process(target=Server.manager, \
-                                  args=(self.state, db_dict, self.enter_lock,self.exit_lock))
-
-    def initialize_socket(self):
-        server_address = (self.ip, self.port)
-        logger.info('starting up on %s port %s' % server_address)
-
-        if self.sock is not None:
-            self.sock.close()
-
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-        sock.bind(server_address)
-        sock.listen(1)
-        self.sock = sock
-
-    def find_free_port(self):
-        """Finds free tcp/ip port starting from self.port"""
-        while True:
-            try:
-                self.initialize_socket()
-                break
-            except Exception as e:
-                logger.error(e)
-                self.port += 1
+                                  args=(self.state, db_dict, self.barrier, self.metrics, self.history))
 
     @classmethod
-    def server(cls, protocol, connection, state, enter_lock, exit_lock):
+    def server(cls, protocol, connection, state, barrier, metrics, history, arrays=None):
         """
-        Downloads data from client
-        and sends requested state variables
+        Serves one connection until client disconnects,
+        every message carries data from client and request for state variables.
+        Client may start with session handshake (see ServerSession)
 
         Static function used as target for serving processes
+        :param arrays: {name: ArrayVariable} of array variables
+        :return: number of exchanges served
         """
-        #while True:
-        if 1:
-            try:
-
-
-                logger.info('%d Downloading simulation results'%os.getpid())
-                received_data = protocol.receive(connection)
-                data = received_data["data"]
-                request = received_data["request"]
-                logger.info('%d Received Results: %s' % (os.getpid(),data))
-                logger.info('%d Received Request: %s' % (os.getpid(), request))
-
-                logger.info('%d Acquiring enter lock' % os.getpid())
-                enter_lock.acquire()
-                state[cls.WAIT_FOR_N] += 1
-                enter_lock.release()
-
-                for k,v in data.items():
-                    if k in state.keys():
-                        state[k] = v
-
-                logger.info('%d Waiting for full state update'%os.getpid())
-
-                logger.info('%d Acquiring exit lock' % os.getpid())
-                #exit_lock.acquire()
-                #exit_lock.release()
-                exit_lock.acquire()
-                data_to_send = {key:val for key,val in state.items() if key in set(request)}
-                data_to_send[cls.TIME] = state[cls.TIME]
-
-
-                state[cls.WAIT_FOR_N] -= 1
-                exit_lock.release()
-
-
-                logger.info('%d Sending: %s ' % (os.getpid(),data_to_send))
-                protocol.send(connection, data_to_send)
+        exchanges = 0
+        session = ServerSession([k for k in state.keys() if k not in cls.CONFIG_STATES], cls.TIME,\
+                                binary=hasattr(protocol, 'BINARY'), arrays=arrays)
+        metrics.add('connections')
+        metrics.add('clients')
+        try:
+            while True:
+                logger.debug('%d Downloading simulation results', os.getpid())
+                t = time.perf_counter()
+                try:
+                    received_data = protocol.receive(connection)
+                except ConnectionError:
+                    logger.debug('%d Client disconnected', os.getpid())
+                    break
+                received_data = session.decompress(received_data)
+                metrics.observe('receive', time.perf_counter() - t)
+                if session.is_stats_request(received_data):
+                    protocol.send(connection, metrics.snapshot())
+                    continue
+                if session.is_history_request(received_data):
+                    protocol.send(connection, session.history(received_data, history))
+                    continue
+                if session.is_handshake(received_data):
+                    if session.simulation_name(received_data) != ServerSession.DEFAULT_SIMULATION:
+                        protocol.send(connection, {ServerSession.ERROR: 'Named simulations are served by sharded engine'})
+                        continue
+                    protocol.send(connection, session.handshake(received_data, state[cls.TIME]))
+                    continue
+                try:
+                    if session.is_block(received_data):
+                        block, request = session.block(received_data)
+                    else:
+                        data, request = session.step(received_data)
+                except Exception as e:
+                    # invalid message is answered, connection is kept
+                    logger.error('%d Invalid message: %s', os.getpid(), e)
+                    protocol.send(connection, {ServerSession.ERROR: str(e)})
+                    continue
+                if session.is_block(received_data):
+                    # every step of block passes barrier, but without round trip to client
+                    response = session.block_response([cls.exchange(state, data, request, barrier, metrics)\
+                                                       for data in block])
+                else:
+                    data_to_send = cls.exchange(state, data, request, barrier, metrics)
+                    if payload_sampled(logger, data_to_send[cls.TIME]):
+                        logger.debug('%d Sending: %s', os.getpid(), data_to_send)
+                    response = session.response(data_to_send)
+                t = time.perf_counter()
+                protocol.send(connection, response)
+                metrics.observe('send', time.perf_counter() - t)
+                metrics.add('exchanges')
+                exchanges += 1
+        finally:
+            metrics.add('clients', -1)
+            # Clean up the connection
+            logger.debug("%d Closing connection",os.getpid())
+            connection.close()
+        return exchanges
 
+    @classmethod
+    def worker(cls, sock, transport, protocol, state, barrier, metrics, history, max_exchanges, arrays=None):
+        """
+        Target of pre-forked worker processes, accepts connections on shared listening socket
+        and serves them one by one, returns when it has served max_exchanges
+        (connection is never interrupted, the limit is checked after it is closed)
+        """
+        served = 0
+        try:
+            while max_exchanges is None or served < max_exchanges:
+                connection, client_address = sock.accept()
+                transport.configure(connection)
+                logger.debug('%d connection from %s', os.getpid(), client_address)
+                served += cls.server(protocol, connection, state, barrier, metrics, history, arrays)
+        except Exception as e:
+            logger.error('%d Worker failed: %s', os.getpid(), e)
+            raise
 
-            finally:
-                # Clean up the connection
-                logger.info("%d Closing connection",os.getpid())
-                #connection.close()
+    @classmethod
+    def exchange(cls, state, data, request, barrier, metrics):
+        """
+        Puts client data into state, waits for full state update
+        and returns requested variables
+        """
+        logger.debug('%d Entering step', os.getpid())
+        t0 = time.perf_counter()
+        step = barrier.enter()
+        if payload_sampled(logger, step):
+            logger.debug('%d Received Results: %s', os.getpid(), data)
+            logger.debug('%d Received Request: %s', os.getpid(), request)
+        try:
+            t1 = time.perf_counter()
+            for k,v in data.items():
+                if k in state:
+                    state[k] = v
+            barrier.arrive()
+
+            logger.debug('%d Waiting for full state update', os.getpid())
+            t2 = time.perf_counter()
+            barrier.wait_release(step)
+            t3 = time.perf_counter()
+            if isinstance(state, SharedStateStore):
+                # values are read straight from shared memory
+                data_to_send = {key:state[key] for key in request if key in state}
+            else:
+                # one call of manager process, subscription of session is already a set
+                requested = request if isinstance(request, frozenset) else set(request)
+                data_to_send = {key:val for key,val in state.items() if key in requested}
+            data_to_send[cls.TIME] = state[cls.TIME]
+        finally:
+            barrier.leave()
+        t4 = time.perf_counter()
+        metrics.observe('enter', t1 - t0)
+        metrics.observe('update', t2 - t1)
+        metrics.observe('wait', t3 - t2)
+        metrics.observe('read', t4 - t3)
+        return data_to_send
 
     @classmethod
-    def manager(cls, state, db_dict, enter_lock, exit_lock):
-        """Communicates with database and blocks exit and entrance to the server"""
+    def manager(cls, state, db_dict, barrier, metrics, history):
+        """
+        Communicates with database and drives step barrier:
+        sleeps until the last variable of the step arrives, releases serving processes,
+        resets state when all of them have left
+        """
+        database_updater = None
         try:
             database_updater = db_dict['class'].recreate_database_updater(db_dict)
-            exit_lock.acquire()
+            db_update_time = state[cls.DB_UPDATE_TIME]
             t = time.time()
             while True:
-                if time.time() - t > state[cls.DB_UPDATE_TIME]:
+                waited = barrier.wait_complete(lambda: cls.is_complete(state),\
+                                               max(db_update_time - (time.time() - t), 0))
+                if time.time() - t > db_update_time:
                     t = time.time()
                     database_updater.commit()
-                if not (None in state.values()): # state gathered
-                    enter_lock.acquire()
-                    exit_lock.release()
-
-                    state_cp = state.copy()
-
-                    while state[cls.WAIT_FOR_N] != 0:
-                        time.sleep(state[cls.WAIT_TIME])
-                    # state sent
-
-                    Server.reset_state(state)
-                    exit_lock.acquire()
-                    enter_lock.release()
-
-                    database_updater.add(state_cp)
-                    logger.info('Next iteration, time: {}'.format(state[cls.TIME]))
+                    metrics.observe('commit', time.time() - t)
+                if waited is None:
+                    continue
+                # state gathered
+                state_cp = state.copy()
+                # recorded before release, so clients asking for history after their step find it there
+                if history is not None:
+                    history.append(state_cp[cls.TIME], state_cp)
+                metrics.add('steps')
+                barrier.release()
+                drained = barrier.wait_drained()
+                # state sent
+
+                Server.reset_state(state)
+                barrier.advance()
+
+                t_add = time.perf_counter()
+                database_updater.add(state_cp)
+                metrics.observe('db_add', time.perf_counter() - t_add)
+                metrics.observe('gather', waited)
+                metrics.observe('drain', drained)
+                if sampled(state[cls.TIME]):
+                    logger.info('Next iteration, time: %d, waited for state: %.6f s, for clients: %.6f s',\
+                                state[cls.TIME], waited, drained)
 
 
         finally:
-            logger.error('TERMINATION of manager')
+            try:
+                logger.error('TERMINATION of manager')
+            finally:
+                # rows added since the last commit are lost otherwise
+                if database_updater is not None:
+                    database_updater.close()
+
+    @classmethod
+    def is_complete(cls, state):
+        """True when all state variables were sent by clients"""
+        if isinstance(state, SharedStateStore):
+            return state.is_complete()
+        return not (None in state.values())
 
     @classmethod
     def reset_state(cls,state):
+        if isinstance(state, SharedStateStore):
+            state.reset()
+            return
         for k in state.keys():
             if k not in cls.CONFIG_STATES:
                 state[k] = None
         state[cls.TIME] += 1
 
-    def initialize_state(self,names,wait_time,db_update_time):
+    def initialize_state(self,names,db_update_time):
         for k in names:
             if k not in self.CONFIG_STATES:
                 self.state[k] = None
         self.state[self.TIME] = int(1)
-        self.state[self.WAIT_FOR_N] = 0
-        self.state[self.WAIT_TIME] = wait_time
         self.state[self.DB_UPDATE_TIME] = db_update_time
 
+    def start_worker(self):
+        p = Process(target=Server.worker, daemon=True, \
+                    args=(self.sock, self.transport, self.protocol, self.state, self.barrier, self.metrics,\
+                          self.history, self.max_exchanges, self.arrays))
+        p.start()
+        return p
+
+    def queued(self):
+        """True when every worker serves a connection and other connections wait in accept backlog"""
+        return self.metrics.counter('clients') >= self.workers and bool(select.select([self.sock], [], [], 0)[0])
+
+    def run_pool(self):
+        """
+        Keeps pool of workers full, finished workers are joined and replaced.
+        Warns when connections wait for busy workers: clients keep their worker until they disconnect
+        and steps wait for all clients, so clients which are not served stop the simulation.
+        """
+        pool = [self.start_worker() for _ in range(self.workers)]
+        logger.info('%d workers accepting connections', self.workers)
+        warned = False
+        while True:
+            wait([p.sentinel for p in pool], self.POOL_CHECK)
+            queued = self.queued()
+            if queued and not warned:
+                logger.warning('All %d workers are busy and connections are waiting, steps stop '
+                               'when clients of waiting connections take part in them, use more workers',
+                               self.workers)
+            warned = queued
+            for i, p in enumerate(pool):
+                if not p.is_alive():
+                    p.join()
+                    logger.info('worker %d finished with code %s, starting new one', p.pid, p.exitcode)
+                    pool[i] = self.start_worker()
+
     def start(self):
         """
         Server main loop. Listens for connections
@@ -213,25 +370,75 @@ class Server(object):
         """
         try:
             self.db_updater.start()
+            start_dumping(self.metrics, self.stats_interval)
+            if self.workers:
+                self.run_pool()
             while True:
-                logger.info('waiting for connection')
+                logger.debug('waiting for connection')
                 connection, client_address = self.sock.accept()
-                logger.info('connection from %s, creating separate process: %d' % (client_address))
+                self.transport.configure(connection)
+                logger.debug('connection from %s, creating separate process', client_address)
                 p = Process(target=Server.server, \
-                            args=(self.protocol,connection, self.state,self.enter_lock,self.exit_lock))
+                            args=(self.protocol,connection, self.state,self.barrier,self.metrics,self.history,self.arrays))
                 p.start()
+                connection.close() # owned by serving process now
+                active_children() # joins processes of closed connections
         except:
             self.sock.close()
+            self.transport.close()
+            if isinstance(self.state, SharedStateStore):
+                self.state.close()
 
 
 def parse_server_args():
     parser = argparse.ArgumentParser(description="To set up server app required is ip address")
     parser.add_argument('-ip',dest='ip',help='server phisical ip address')
     parser.add_argument('--port',dest='port',help='server phisical tcp port')
+    parser.add_argument('--address',dest='address',\
+                        help='tcp:host:port or unix:path of socket file for clients on the same host, overrides -ip and --port')
+    parser.add_argument('--socket-buffer',dest='socket_buffer',type=int,\
+                        help='send and receive buffer of sockets in bytes, system defaults if not set')
     parser.add_argument('--login',dest='login',action='store_true',\
                         help='Configure database manually, if not set default(debugging) settings are used')
+    parser.add_argument('--protocol',dest='protocol',default='confirmation',choices=sorted(PROTOCOLS),\
+                        help='message framing, clients have to use the same one')
+    parser.add_argument('--engine',dest='engine',default='process',choices=['process','asyncio','sharded'],\
+                        help='process per connection, single asyncio event loop or named simulations sharded over workers')
+    parser.add_argument('--workers',dest='workers',type=int,\
+                        help='number of worker processes of sharded engine (number of cores by default) '\
+                             'or pre-forked workers of process engine (at least number of clients, '\
+                             'process per connection by default)')
+    parser.add_argument('--max-exchanges',dest='max_exchanges',type=int,\
+                        help='pre-forked worker of process engine is replaced after serving that many exchanges, '\
+                             'checked when its connection closes, so workers of sessions are kept until sessions end')
+    parser.add_argument('--federation',dest='federation',\
+                        help='JSON file with nodes of federation and their variables (asyncio engine)')
+    parser.add_argument('--node',dest='node',help='node of federation run by this server, its address is used')
+    parser.add_argument('--state-store',dest='state_store',default='manager',choices=['manager','shared'],\
+                        help='state of process engine: Manager().dict() or shared memory array')
+    parser.add_argument('--db-writer',dest='db_writer',default='session',choices=['session','batched','columnar'],\
+                        help='ORM session committed by manager, batched inserts from background thread '\
+                             'or local columnar log file (no database needed)')
+    parser.add_argument('--db-file',dest='db_file',default='simulation_states.col',\
+                        help='file of columnar db writer, load it to database with: python columnar_log.py load')
+    parser.add_argument('--stats-interval',dest='stats_interval',type=float,\
+                        help='seconds between metrics written to server.log, metrics are always sent on stats request')
+    parser.add_argument('--history',dest='history',type=int,default=1000,\
+                        help='number of recent steps kept in memory for history requests, 0 - none')
+    parser.add_argument('--log-level',dest='log_level',default='INFO',choices=['DEBUG','INFO','WARNING','ERROR'],\
+                        help='DEBUG logs exchanged data of sampled steps')
+    parser.add_argument('--log-every',dest='log_every',type=int,default=100,\
+                        help='only every n-th step is logged, 0 - steps are not logged')
+    parser.add_argument('--log-sync',dest='log_sync',action='store_true',\
+                        help='write log records in serving processes instead of background thread')
 
     args = parser.parse_args()
+    if (args.federation is None) != (args.node is None):
+        parser.error('--federation and --node have to be given together')
+    if args.federation is not None and args.engine != 'asyncio':
+        parser.error('federation nodes are run by asyncio engine')
+    if args.address is not None:
+        args.ip = args.address
     if args.ip is None:
         args.ip = '127.0.0.1'
     if args.port is None:
@@ -244,28 +451,45 @@ def parse_server_args():
 
 if __name__ == "__main__":
     args = parse_server_args()
+    configure_logging('server.log', getattr(logging, args.log_level), queued=not args.log_sync,\
+                      sample_every=args.log_every)
     if args.login and MODE!=Mode.SIMULATION:
         MODE = Mode.LOGIN
-    if MODE == Mode.LOGIN:
+    if MODE != Mode.SIMULATION:
+        updater_class = BatchedDatabaseUpdater if args.db_writer == 'batched' else DatabaseUpdater
+    if args.db_writer == 'columnar':
+        database_updater = ColumnarLogUpdater('', '', args.db_file)
+    elif MODE == Mode.LOGIN:
         print('Database configuration')
         host = input('Database host: ')
         base = input('Database: ')
         login = input('Login: ')
         password = getpass.getpass()
-        database_updater = DatabaseUpdater(login, password, base, host)
+        database_updater = updater_class(login, password, base, host)
     elif MODE == Mode.DEBUG:
-        database_updater = DatabaseUpdater('luki', 'luki', 'luki_testing','192.168.43.198')
+        database_updater = updater_class('luki', 'luki', 'luki_testing','192.168.43.198')
     elif MODE == Mode.SIMULATION:
         database_updater = DatabaseUpdaterSimulator('luki', 'luki', 'luki_testing','localhost')
     else:
         raise Exception('Unrecoginzed MODE')
 
-    server = Server(args.ip,args.port,database_updater)
-    # TODO remove f operations (debug)
-    f = open("port.txt","w")
-    f.write(str(server.port))
-    f.close()
-    print("Starting server on ip {} port {}".format(server.ip,server.port))
+    if args.federation is not None:
+        server = FederatedServer(Federation.load(args.federation),args.node,database_updater,\
+                                 protocol=get_protocol(args.protocol),stats_interval=args.stats_interval,\
+                                 history=args.history,buffer_size=args.socket_buffer)
+    elif args.engine == 'asyncio':
+        server = AsyncServer(args.ip,args.port,database_updater,protocol=get_protocol(args.protocol),\
+                             stats_interval=args.stats_interval,history=args.history,buffer_size=args.socket_buffer)
+    elif args.engine == 'sharded':
+        server = ShardedServer(args.ip,args.port,database_updater,workers=args.workers,protocol=get_protocol(args.protocol),\
+                               stats_interval=args.stats_interval,history=args.history,buffer_size=args.socket_buffer)
+    else:
+        server = Server(args.ip,args.port,database_updater,protocol=get_protocol(args.protocol),\
+                        state_store=args.state_store,stats_interval=args.stats_interval,history=args.history,\
+                        buffer_size=args.socket_buffer,workers=args.workers,max_exchanges=args.max_exchanges)
+    # clients started in the same directory read address from endpoint file
+    write_endpoint(server.transport.address)
+    print("Starting server on {}".format(server.transport.address))
     server.start()
 
 
@@ -0,0 +1,339 @@
+import logging
+
+from arrays import array_variables, to_arrays
+from codec import SchemaCodec
+from compression import Compressor
+from delta import DeltaDecoder, DeltaEncoder
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSession(object):
+    """
+    State of one client connection kept by serving process.
+    Client may start a session with handshake message:
+    {"session": {"name": client name, "data": [sent variables], "request": [requested variables]}}
+    afterwards request can be omitted in exchanged messages.
+    Handshake with "codec": "schema" asks for binary messages (see SchemaCodec),
+    server agrees when protocol carries bytes and sends variable schema in response.
+    Handshake with "simulation": name joins named simulation on servers hosting many of them.
+    Message {"stats": null} is answered with server metrics (see Metrics.snapshot) instead of exchange.
+    Message {"history": {"variables": [...], "from": t1, "to": t2}} is answered with
+    {"history": {"time": [...], variable: [...]}} of recent steps (see StateHistory.query).
+    Message {"block": [data of step, data of next step, ...], "request": [...]} exchanges
+    several consecutive steps at once, response is {"block": [requested variables of every step]}.
+    Blocks are always sent as JSON, also in sessions using binary codec.
+    Handshake with "delta": true starts delta session: client sends only variables
+    which changed since its previous step, variables it omits keep their last value
+    and count toward completing the step, responses carry only requested values
+    which changed since the previous response (see delta.py).
+    Server node of federation may answer handshake with {"redirect": address, "node": name}
+    when variables sent by client are owned by other node, client starts session there.
+    Handshake with "compression": {"method": "zlib", "threshold": bytes, "level": 1, "dictionary": true}
+    compresses large messages of the session, server agrees when protocol carries bytes (see compression.py).
+    Handshake response lists array variables as "arrays": {name: [typecode, shape]} (see arrays.py),
+    arrays sent as JSON lists are converted and checked against their declaration.
+    Connections without handshake are served like before, one message with data and request at a time.
+    """
+    SESSION = "session"
+    DATA = "data"
+    REQUEST = "request"
+    ERROR = "error"
+    CODEC = "codec"
+    SCHEMA = "schema"
+    DELTA = "delta"
+    SIMULATION = "simulation"
+    ARRAYS = "arrays"
+    COMPRESSION = "compression"
+    REDIRECT = "redirect"
+    NODE = "node"
+    STATS = "stats"
+    HISTORY = "history"
+    BLOCK = "block"
+    MAX_BLOCK = 1024
+    DEFAULT_SIMULATION = ""
+
+    def __init__(self, variables, time_name="time", binary=False, arrays=None):
+        """
+        :param variables: names of state variables known to the server
+        :param time_name: name of step counter sent along with requested variables
+        :param binary: protocol can send bytes, so binary codec may be negotiated
+        :param arrays: {name: ArrayVariable} of array variables among variables
+        """
+        self.variables = set(variables)
+        self.schema = sorted(self.variables)
+        self.time_name = time_name
+        self.binary = binary
+        self.arrays = arrays or {}
+        self.name = None
+        self.node = None # federation node pushing its variables over this connection
+        self.data = None
+        self.request = None
+        self.codec = None
+        self.compressor = None
+        self.delta = False
+        self._received = None
+        self._sent = None
+
+    @classmethod
+    def is_handshake(cls, message):
+        return isinstance(message, dict) and cls.SESSION in message
+
+    @classmethod
+    def is_block(cls, message):
+        return isinstance(message, dict) and cls.BLOCK in message
+
+    @classmethod
+    def is_stats_request(cls, message):
+        return isinstance(message, dict) and cls.STATS in message
+
+    @classmethod
+    def is_history_request(cls, message):
+        return isinstance(message, dict) and cls.HISTORY in message
+
+    def history(self, message, history):
+        """
+        Answers history request
+        :param history: StateHistory of simulation, None when server keeps no history
+        """
+        if history is None:
+            return {self.ERROR: 'Server keeps no history'}
+        query = message[self.HISTORY] or {}
+        try:
+            return self.compress({self.HISTORY: history.query(query.get("variables"), query.get("from"), query.get("to"))})
+        except Exception as e:
+            return {self.ERROR: str(e)}
+
+    @classmethod
+    def simulation_name(cls, message):
+        """Name of simulation chosen by the first message of connection"""
+        if cls.is_handshake(message):
+            return (message[cls.SESSION] or {}).get(cls.SIMULATION) or cls.DEFAULT_SIMULATION
+        return cls.DEFAULT_SIMULATION
+
+    def handshake(self, message, time):
+        """
+        Registers client identity and declared variables
+        :param message: received handshake
+        :param time: current step
+        :return: response for the client
+        """
+        hello = message[self.SESSION] or {}
+        data = hello.get(self.DATA) or []
+        request = hello.get(self.REQUEST)
+        unknown = [k for k in list(data) + list(request or []) if k not in self.variables]
+        if unknown:
+            logger.error('Session %s declared unknown variables: %s', hello.get('name'), unknown)
+            return {self.ERROR: 'Unknown variables: %s' % ', '.join(unknown)}
+        self.name = hello.get('name')
+        self.node = hello.get(self.NODE)
+        self.data = list(data)
+        self.request = frozenset(request) if request is not None else None # subscription of session
+        response = {self.SESSION: self.name, self.time_name: time, "variables": self.schema}
+        if self.arrays:
+            response[self.ARRAYS] = {k: spec.declaration() for k, spec in self.arrays.items()}
+        if hello.get(self.CODEC) == SchemaCodec.NAME and self.binary:
+            self.codec = SchemaCodec(self.schema, self.time_name, self.arrays)
+            response[self.CODEC] = SchemaCodec.NAME
+            response[self.SCHEMA] = self.schema
+        if hello.get(self.DELTA):
+            self.delta = True
+            self._received = DeltaDecoder()
+            self._sent = DeltaEncoder()
+            response[self.DELTA] = True
+        self.compressor = None
+        if hello.get(self.COMPRESSION) and self.binary:
+            self.compressor = Compressor.negotiate(hello[self.COMPRESSION], self.schema, self.time_name)
+            if self.compressor is not None:
+                response[self.COMPRESSION] = self.compressor.settings()
+        logger.info('Session %s started, data: %s, request: %s, codec: %s, delta: %s, compression: %s',\
+                    self.name, self.data, self.request, response.get(self.CODEC), self.delta,\
+                    response.get(self.COMPRESSION))
+        return response
+
+    def compress(self, message):
+        """Outgoing message of session, compressed when compression was negotiated"""
+        if self.compressor is None:
+            return message
+        return self.compressor.compress(message)
+
+    def decompress(self, message):
+        """Received message, decompressed when compression was negotiated"""
+        if self.compressor is None:
+            return message
+        return self.compressor.decompress(message)
+
+    def step(self, message):
+        """
+        Returns data and request of exchange message (python data structure or bytes of codec),
+        request declared in handshake is used when message has none
+        """
+        if isinstance(message, bytes):
+            data, request = self.codec.decode_step(message)
+            request = self._request(request) # checked before delta state of session changes
+            return self._expand(data), request
+        request = self._request(message.get(self.REQUEST))
+        return self._expand(to_arrays(message[self.DATA], self.arrays)), request
+
+    def _expand(self, data):
+        """Complete data of step in delta session"""
+        if not self.delta:
+            return data
+        return self._received.decode(data)
+
+    def _changed(self, data_to_send):
+        """Only changed values of response in delta session"""
+        if not self.delta:
+            return data_to_send
+        return self._sent.encode(data_to_send, (self.time_name,))
+
+    def _request(self, request):
+        """Request of message, the one declared in handshake when message has none"""
+        if request is None:
+            request = self.request
+        if request is None:
+            raise Exception('Request was not sent and session does not declare it')
+        return request
+
+    def block(self, message):
+        """Returns list of data of consecutive steps and request of block message"""
+        block = message[self.BLOCK]
+        if not block or len(block) > self.MAX_BLOCK:
+            raise Exception('Block has to contain from 1 to %d steps' % self.MAX_BLOCK)
+        request = self._request(message.get(self.REQUEST))
+        block = [to_arrays(data, self.arrays) for data in block] # all steps are checked before delta state changes
+        return [self._expand(data) for data in block], request
+
+    def block_response(self, responses):
+        return self.compress({self.BLOCK: [self._changed(data_to_send) for data_to_send in responses]})
+
+    def response(self, data_to_send):
+        """Encodes response with negotiated codec"""
+        data_to_send = self._changed(data_to_send)
+        if self.codec is not None:
+            data_to_send = self.codec.encode_response(data_to_send)
+        return self.compress(data_to_send)
+
+
+class ClientSession(object):
+    """
+    Client end of session without socket I/O, shared by client.Client and async_client.AsyncClient:
+    builds handshake and exchanged messages, applies codec, delta encoding
+    and compression negotiated in handshake response (see ServerSession).
+    Object made without handshake response sends plain JSON messages like clients without session.
+    """
+    TIME = "time"
+
+    def __init__(self, name=None, data=None, request=None, codec=None, simulation=None, delta=False,
+                 compression=None, zdict=False):
+        """Parameters are described in Client.open_session"""
+        hello = {"name": name, ServerSession.DATA: data or [], ServerSession.REQUEST: request}
+        if codec is not None:
+            hello[ServerSession.CODEC] = codec
+        if simulation is not None:
+            hello[ServerSession.SIMULATION] = simulation
+        if delta:
+            hello[ServerSession.DELTA] = True
+        if compression is not None:
+            hello[ServerSession.COMPRESSION] = {"method": Compressor.NAME, "threshold": compression,
+                                                "dictionary": zdict}
+        self.hello = hello
+        self.arrays = {} # array variables declared in handshake response
+        self.codec = None
+        self.compressor = None
+        self._sent = None # delta session
+        self._received = None
+
+    def handshake(self):
+        return {ServerSession.SESSION: self.hello}
+
+    def start(self, response):
+        """
+        Applies handshake response
+        :return: address of federation node the session has to be opened at, None when session has started
+        """
+        if ServerSession.ERROR in response:
+            raise Exception(response[ServerSession.ERROR])
+        if ServerSession.REDIRECT in response:
+            logger.info("Session redirected to node %s: %s", response.get(ServerSession.NODE),
+                        response[ServerSession.REDIRECT])
+            return response[ServerSession.REDIRECT]
+        self.arrays = array_variables(response.get(ServerSession.ARRAYS))
+        if response.get(ServerSession.CODEC) == SchemaCodec.NAME:
+            self.codec = SchemaCodec(response[ServerSession.SCHEMA], arrays=self.arrays)
+        if response.get(ServerSession.DELTA):
+            self._sent = DeltaEncoder()
+            self._received = DeltaDecoder()
+        if response.get(ServerSession.COMPRESSION):
+            self.compressor = Compressor.negotiate(response[ServerSession.COMPRESSION], response["variables"])
+        logger.info("Session started: %s", response)
+        return None
+
+    def pack(self, message):
+        """Message as sent over connection, compressed when compression was negotiated"""
+        if self.compressor is None:
+            return message
+        return self.compressor.compress(message)
+
+    def unpack(self, message):
+        """Received message, error sent by server is raised"""
+        if self.compressor is not None:
+            message = self.compressor.decompress(message)
+        if isinstance(message, dict) and ServerSession.ERROR in message:
+            raise Exception(message[ServerSession.ERROR])
+        return message
+
+    def _response_names(self, request):
+        """Variables of full response in delta session"""
+        if request is None:
+            request = self.hello[ServerSession.REQUEST] or []
+        return list(request) + [self.TIME]
+
+    def step(self, data, request=None):
+        """:return: message with data of one step"""
+        if self._sent is not None:
+            data = self._sent.encode(data)
+        if self.codec is not None:
+            return self.pack(self.codec.encode_step(data, request))
+        message = {ServerSession.DATA: data}
+        if request is not None:
+            message[ServerSession.REQUEST] = request
+        return self.pack(message)
+
+    def step_response(self, response, request=None):
+        """:return: requested data of received response to step"""
+        response = self.unpack(response)
+        if self.codec is not None:
+            response = self.codec.decode_response(response)
+        else:
+            response = to_arrays(response, self.arrays) # the same types as decoded by codec
+        if self._received is not None:
+            response = self._received.decode(response, self._response_names(request))
+        return response
+
+    def block(self, block, request=None):
+        """:return: message with data of consecutive steps"""
+        if self._sent is not None:
+            block = [self._sent.encode(data) for data in block]
+        message = {ServerSession.BLOCK: block}
+        if request is not None:
+            message[ServerSession.REQUEST] = request
+        return self.pack(message)
+
+    def block_response(self, response, request=None):
+        """:return: list of requested data of every step"""
+        block = [to_arrays(data, self.arrays) for data in self.unpack(response)[ServerSession.BLOCK]]
+        if self._received is None:
+            return block
+        names = self._response_names(request)
+        return [self._received.decode(data, names) for data in block]
+
+    def history(self, variables=None, first=None, last=None):
+        """:return: history request, parameters are described in Client.history"""
+        return self.pack({ServerSession.HISTORY: {"variables": variables, "from": first, "to": last}})
+
+    def history_response(self, response):
+        return self.unpack(response)[ServerSession.HISTORY]
+
+    def stats(self):
+        return self.pack({ServerSession.STATS: None})
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import zlib
+from multiprocessing import Pipe, Process, reduction
+
+from async_server import AsyncServer
+from metrics import start_dumping
+from protocol import ConfirmationProtocolManager
+from session import ServerSession
+from transport import parse_address
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedServer(object):
+    """
+    Hosts many named simulations (see AsyncServer, Simulation) on one listening socket.
+    Simulations are distributed over pool of worker processes, each of them runs
+    AsyncServer event loop. Accepting process receives the first message of every connection
+    (session handshake naming the simulation), chooses worker owning the simulation
+    and passes the socket to it, so all clients of one simulation meet in one worker.
+    Every worker has its own metrics, stats request without handshake is answered
+    by worker of the default simulation.
+    """
+
+    def __init__(self, ip, port, db_updater, workers=None, db_update_time=1,
+                 protocol=ConfirmationProtocolManager(), db_factory=None, stats_interval=None, history=1000,
+                 buffer_size=None):
+        """
+        :param ip: phisical ip address of host machine or address of transport (e.g. unix:/tmp/server.sock)
+        :param port: indicates where to start searching for free tcp/ip port
+        :param db_updater: template of database updaters, recreated in workers (see AsyncServer.default_db_factory)
+        :param workers: number of worker processes, number of cores by default
+        :param db_update_time: seconds between database commits
+        :param protocol: protocol manager, its receive is used for first message and receive_async by workers
+        :param db_factory: function of simulation name returning its database updater
+        :param stats_interval: seconds between metrics of every worker written to log
+        :param history: number of recent steps kept by every simulation for history requests, 0 - none
+        :param buffer_size: socket buffers in bytes, None - system defaults
+        """
+        self.ip = ip
+        self.db_updater = db_updater
+        self.workers = workers or os.cpu_count()
+        self.db_update_time = db_update_time
+        self.protocol = protocol
+        self.db_factory = db_factory
+        self.stats_interval = stats_interval
+        self.history = history
+        self._pipes = []
+        self._locks = []
+        self._processes = []
+
+        self.transport = parse_address(ip, port, buffer_size)
+        self.sock = self.transport.listen()
+        self.port = self.transport.port
+
+    def shard(self, name):
+        """Number of worker owning simulation"""
+        return zlib.crc32(name.encode("utf-8")) % self.workers
+
+    @classmethod
+    def worker(cls, connections, db_updater, db_update_time, protocol, db_factory, stats_interval, history):
+        """
+        Target of worker processes, serves connections received through connections pipe
+        """
+        server = AsyncServer(None, None, db_updater, db_update_time, protocol,
+                             db_factory=db_factory, sock=False, recreate_db=True, stats_interval=stats_interval,
+                             history=history)
+        start_dumping(server.metrics, stats_interval)
+
+        def receive_connections(loop):
+            while True:
+                try:
+                    first_message, protocol_state = connections.recv()
+                    fd = reduction.recv_handle(connections)
+                except EOFError:
+                    break
+                sock = socket.socket(fileno=fd)
+                asyncio.run_coroutine_threadsafe(server.adopt(sock, first_message, protocol_state), loop)
+
+        async def run():
+            threading.Thread(target=receive_connections, args=(asyncio.get_running_loop(),), daemon=True).start()
+            await server.serve()
+
+        try:
+            asyncio.run(run())
+        finally:
+            logger.error('TERMINATION of worker %d', os.getpid())
+
+    def dispatch(self, connection):
+        """Receives first message of connection and passes connection to worker owning its simulation"""
+        try:
+            self.transport.configure(connection)
+            try:
+                first_message = self.protocol.receive(connection)
+            except ConnectionError:
+                return
+            name = ServerSession.simulation_name(first_message)
+            i = self.shard(name)
+            logger.debug('simulation %r served by worker %d', name, i)
+            protocol_state = self.protocol.detach(connection)
+            with self._locks[i]:
+                self._pipes[i].send((first_message, protocol_state))
+                reduction.send_handle(self._pipes[i], connection.fileno(), self._processes[i].pid)
+        except Exception as e:
+            logger.error('Dispatching connection failed: %s', e)
+        finally:
+            connection.close() # worker has its own copy
+
+    def start(self):
+        """
+        Starts workers and passes them accepted connections
+        """
+        try:
+            for i in range(self.workers):
+                parent_end, worker_end = Pipe()
+                p = Process(target=ShardedServer.worker, daemon=True, \
+                            args=(worker_end, self.db_updater, self.db_update_time, self.protocol, self.db_factory,
+                                  self.stats_interval, self.history))
+                p.start()
+                worker_end.close()
+                self._pipes.append(parent_end)
+                self._locks.append(threading.Lock())
+                self._processes.append(p)
+            while True:
+                logger.debug('waiting for connection')
+                connection, client_address = self.sock.accept()
+                logger.debug('connection from %s', client_address)
+                threading.Thread(target=self.dispatch, args=(connection,), daemon=True).start()
+        finally:
+            self.sock.close()
+            self.transport.close()
@@ -0,0 +1,152 @@
+import logging
+from multiprocessing import Lock, shared_memory
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStateStore(object):
+    """
+    State shared by serving processes without manager process.
+    Lives in one multiprocessing.shared_memory block:
+    float64 value of every variable, validity flag of every variable
+    (replaces None of Manager().dict() state), int64 counters (e.g. time step)
+    and float64 settings. Number of valid variables is kept up to date,
+    so complete state is detected in O(1). Array variables (see arrays.py) are valid
+    like scalars, their raw bytes are copied to their own regions at the end of the block.
+    Supports dict operations used by Server: [], in, keys, values, items, copy.
+    """
+
+    def __init__(self, variables, counters=(), settings=(), step_counter=None, name=None, lock=None, arrays=None):
+        """
+        :param variables: names of state variables, None means value is missing
+        :param counters: names of integer entries, e.g. time step
+        :param settings: names of float entries which are always valid
+        :param step_counter: counter increased by reset
+        :param name: name of existing block, new block is created if not given
+        :param lock: lock guarding count of valid variables
+        :param arrays: {name: ArrayVariable} of array variables among variables
+        """
+        self.variables = list(variables)
+        self.counters = list(counters)
+        self.settings = list(settings)
+        self.step_counter = step_counter
+        self._index = {k: i for i, k in enumerate(self.variables)}
+        self._counter_index = {k: i for i, k in enumerate(self.counters)}
+        self._setting_index = {k: i for i, k in enumerate(self.settings)}
+        self._lock = lock if lock is not None else Lock()
+        self.arrays = arrays or {}
+
+        n = len(self.variables)
+        # int64 and float64 parts first, so every part is aligned
+        self._sizes = (8 * (len(self.counters) + 1), 8 * n, 8 * len(self.settings), n)
+        self._array_offsets = {}
+        offset = (sum(self._sizes) + 7) // 8 * 8
+        for k in sorted(self.arrays):
+            self._array_offsets[k] = offset
+            offset += (self.arrays[k].nbytes + 7) // 8 * 8
+        self._size = offset
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(self._size, 1))
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+        self._map_buffers()
+
+    def _map_buffers(self):
+        buf = self._shm.buf
+        c, v, s, f = self._sizes
+        self._counts = buf[0:c].cast('q')  # counters and number of valid variables (last)
+        self._values = buf[c:c + v].cast('d')
+        self._settings = buf[c + v:c + v + s].cast('d')
+        self._valid = buf[c + v + s:c + v + s + f]
+        self._array_views = {k: buf[o:o + self.arrays[k].nbytes] for k, o in self._array_offsets.items()}
+
+    def __getstate__(self):
+        """Other processes attach to the same block"""
+        return {"variables": self.variables, "counters": self.counters, "settings": self.settings,
+                "step_counter": self.step_counter, "name": self._shm.name, "lock": self._lock, "arrays": self.arrays}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def is_complete(self):
+        """True when every variable has value"""
+        return self._counts[len(self.counters)] == len(self.variables)
+
+    def __contains__(self, k):
+        return k in self._index or k in self._counter_index or k in self._setting_index
+
+    def __getitem__(self, k):
+        i = self._index.get(k)
+        if i is not None:
+            if not self._valid[i]:
+                return None
+            if k in self._array_views:
+                return self.arrays[k].array(self._array_views[k])
+            return self._values[i]
+        i = self._counter_index.get(k)
+        if i is not None:
+            return self._counts[i]
+        return self._settings[self._setting_index[k]]
+
+    def __setitem__(self, k, v):
+        i = self._index.get(k)
+        if i is not None:
+            if v is None:
+                with self._lock:
+                    if self._valid[i]:
+                        self._valid[i] = 0
+                        self._counts[len(self.counters)] -= 1
+                return
+            if k in self._array_views:
+                self._array_views[k][:] = memoryview(self.arrays[k].array(v)).cast('B')
+            else:
+                self._values[i] = v
+            if not self._valid[i]:
+                with self._lock:
+                    if not self._valid[i]:
+                        self._valid[i] = 1
+                        self._counts[len(self.counters)] += 1
+            return
+        i = self._counter_index.get(k)
+        if i is not None:
+            self._counts[i] = v
+        else:
+            self._settings[self._setting_index[k]] = v
+
+    def keys(self):
+        return self.variables + self.counters + self.settings
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def copy(self):
+        return dict(self.items())
+
+    def reset(self):
+        """Marks all variables as missing and increases step counter"""
+        with self._lock:
+            self._valid[:] = bytes(len(self.variables))
+            self._counts[len(self.counters)] = 0
+        if self.step_counter is not None:
+            self._counts[self._counter_index[self.step_counter]] += 1
+
+    def close(self):
+        """Detaches from shared memory, block is removed by its creator"""
+        self._counts.release()
+        self._values.release()
+        self._settings.release()
+        self._valid.release()
+        for view in self._array_views.values():
+            view.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -4,6 +4,7 @@ import time
 import argparse
 
 from client import Client
+from transport import read_endpoint
 
 
 def inc_dict(di):
@@ -19,13 +20,14 @@ def parse_args():
     parser.add_argument(dest='num_of_iter')
     parser.add_argument('-l', '--logfile', dest='logfile')
     parser.add_argument('-f',dest='file')
+    parser.add_argument('-s', '--session', dest='session', action='store_true',\
+                        help='keep one connection for all iterations')
     args = parser.parse_args()
 
     args.file = 'input/'+args.file
     args.logfile = 'output/'+args.logfile
     if args.port is None:
-        f = open('../port.txt')
-        args.port = int(f.readline())
+        args.ip = read_endpoint('../endpoint.txt')
     else:
         args.port = int(args.port)
     if args.logfile is None:
@@ -53,6 +55,9 @@ if __name__ == '__main__':
     assert isinstance(request,list)
     assert isinstance(data, dict)
 
+    if args.session:
+        c.open_session(args.file, list(data.keys()), request)
+
     t = time.time()
     n = args.num_of_iter
     my_data = []
@@ -71,6 +76,7 @@ if __name__ == '__main__':
         print("{} - {}".format(received_data[-i], my_data[-i]))
 
     print("Sent {} dicts in {} s".format(n,t))
+    c.close()
     args.logfile.close()
 
 
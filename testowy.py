@@ -3,6 +3,7 @@ import sys
 import time
 
 from client import Client
+from transport import read_endpoint
 
 
 """
@@ -21,11 +22,7 @@ Those are in my pycharmgit
 
 
 if __name__ == '__main__':
-    ip = '127.0.0.1'
-    f = open('port.txt')
-    port = int(f.readline())
-    f.close()
-    c = Client(ip,port)
+    c = Client(read_endpoint())
 
     f = open(sys.argv[1],'r')
     data1 = json.load(f)
@@ -0,0 +1,60 @@
+import array
+import math
+
+from arrays import array_variables
+from codec import SchemaCodec
+from session import ServerSession
+
+VARIABLES = ['Fzm', 'Tzm', 'profile', 'time']
+ARRAYS = {"profile": ("f", [2, 3])}
+
+
+def codec():
+    return SchemaCodec(VARIABLES, arrays=array_variables(ARRAYS))
+
+
+def test_step_round_trip():
+    data, request = codec().decode_step(codec().encode_step({"Fzm": 1.5, "Tzm": -2.25}, ["Tzm", "time"]))
+    assert data == {"Fzm": 1.5, "Tzm": -2.25}
+    assert request == ["Tzm", "time"]
+
+
+def test_nan_round_trips_as_nan():
+    data, _ = codec().decode_step(codec().encode_step({"Fzm": float('nan')}, []))
+    assert math.isnan(data["Fzm"])
+    response = codec().decode_response(codec().encode_response({"time": 3, "Tzm": float('nan')}))
+    assert math.isnan(response["Tzm"])
+
+
+def test_none_is_left_out():
+    data, request = codec().decode_step(codec().encode_step({"Fzm": None, "Tzm": 1.0, "profile": None}, []))
+    assert data == {"Tzm": 1.0}
+    assert request == []
+    assert codec().decode_response(codec().encode_response({"time": 7, "Fzm": None})) == {"time": 7}
+
+
+def test_omitted_request_is_none():
+    payload = codec().encode_step({"Fzm": 1.0})
+    assert SchemaCodec.STEP_HEADER.unpack_from(payload)[1] == SchemaCodec.NO_REQUEST
+    assert codec().decode_step(payload) == ({"Fzm": 1.0}, None)
+
+
+def test_request_declared_in_handshake():
+    session = ServerSession(VARIABLES, binary=True, arrays=array_variables(ARRAYS))
+    response = session.handshake({ServerSession.SESSION: {"name": "c", "data": ["Fzm"], "request": ["Tzm"],
+                                                          "codec": SchemaCodec.NAME}}, 0)
+    client = SchemaCodec(response[ServerSession.SCHEMA], arrays=array_variables(response[ServerSession.ARRAYS]))
+    data, request = session.step(client.encode_step({"Fzm": 2.0}))
+    assert data == {"Fzm": 2.0}
+    assert request == frozenset(["Tzm"])
+    assert client.decode_response(session.response({"time": 1, "Tzm": 4.0})) == {"time": 1, "Tzm": 4.0}
+
+
+def test_arrays_round_trip():
+    profile = [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]
+    data, request = codec().decode_step(codec().encode_step({"Fzm": 1.0, "profile": profile}, ["profile"]))
+    assert data == {"Fzm": 1.0, "profile": array.array('f', [1, 2, 3, 4, 5, 6])}
+    assert request == ["profile"]
+    response = codec().decode_response(codec().encode_response({"time": 2, "profile": array.array('f', range(6))}))
+    assert response == {"time": 2, "profile": array.array('f', range(6))}
+    assert response["profile"].typecode == 'f'
@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from sqlalchemy import create_engine, func, select
+
+from database_updater import BatchedDatabaseUpdater, State
+
+
+def row(t):
+    return dict({k: 0.5 * t for k in State.COLUMNS}, time=t)
+
+
+def count(path):
+    engine = create_engine('sqlite:///%s' % path)
+    try:
+        with engine.connect() as con:
+            return con.execute(select(func.count()).select_from(State.__table__)).scalar()
+    finally:
+        engine.dispose()
+
+
+def wait_for(path, rows, timeout=5.0):
+    """:return: number of rows in table once it reaches rows or timeout passes"""
+    deadline = time.time() + timeout
+    n = count(path)
+    while n < rows and time.time() < deadline:
+        time.sleep(0.02)
+        n = count(path)
+    return n
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'states.db')
+
+
+def updater(path, **kwargs):
+    return BatchedDatabaseUpdater('', '', path, dialect='sqlite', **kwargs)
+
+
+def test_batch_is_written_when_full(path):
+    db = updater(path, batch_size=3, flush_time=60)
+    try:
+        for t in range(1, 5):
+            db.add(row(t))
+        assert wait_for(path, 3) == 3
+        time.sleep(0.2)
+        assert count(path) == 3 # fourth row waits for next batch
+    finally:
+        db.close()
+    assert count(path) == 4
+
+
+def test_rows_are_written_after_flush_time(path):
+    db = updater(path, batch_size=1000, flush_time=0.2)
+    try:
+        db.add(row(1))
+        db.add(row(2))
+        assert wait_for(path, 2) == 2
+    finally:
+        db.close()
+
+
+def test_close_writes_remaining_rows(path):
+    db = updater(path, batch_size=1000, flush_time=60)
+    for t in range(1, 6):
+        db.add(row(t))
+    db.close()
+    assert count(path) == 5
+    engine = create_engine('sqlite:///%s' % path)
+    try:
+        with engine.connect() as con:
+            times = [r.time for r in con.execute(select(State.__table__.c.time).order_by('time'))]
+    finally:
+        engine.dispose()
+    assert times == [1, 2, 3, 4, 5]
+
+
+def test_db_dict_recreates_updater(path):
+    db = updater(path, batch_size=7, flush_time=0.5, queue_size=20)
+    db_dict = db.get_db_dict()
+    db.close()
+    recreated = db_dict['class'].recreate_database_updater(db_dict)
+    try:
+        assert isinstance(recreated, BatchedDatabaseUpdater)
+        assert recreated.get_db_dict() == db_dict
+        assert (recreated.dialect, recreated.batch_size, recreated.flush_time, recreated.queue_size) == \
+            ('sqlite', 7, 0.5, 20)
+        recreated.add(row(1))
+    finally:
+        recreated.close()
+    assert count(path) == 1
@@ -0,0 +1,80 @@
+import socket
+import zlib
+
+import pytest
+
+from protocol import PipelinedProtocolManager, ProtocolError
+
+HEADER = PipelinedProtocolManager.HEADER
+
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair()
+    a.settimeout(5)
+    b.settimeout(5)
+    yield a, b
+    a.close()
+    b.close()
+
+
+def sent_frames(messages):
+    """:return: raw frames written by pipelined protocol for messages sent on fresh connection"""
+    protocol = PipelinedProtocolManager()
+    a, b = socket.socketpair()
+    try:
+        for message in messages:
+            protocol.send(a, message)
+        frames = []
+        for _ in messages:
+            header = b.recv(HEADER.size, socket.MSG_WAITALL)
+            length = HEADER.unpack(header)[0]
+            frames.append(header + b.recv(length, socket.MSG_WAITALL))
+        return frames
+    finally:
+        a.close()
+        b.close()
+
+
+def test_frames_are_received_in_order(pair):
+    a, b = pair
+    for frame in sent_frames([{"data": 1}, b'\x00\x01']):
+        a.sendall(frame)
+    receiver = PipelinedProtocolManager()
+    assert receiver.receive(b) == {"data": 1}
+    assert receiver.receive(b) == b'\x00\x01'
+
+
+def test_lost_frame_is_detected(pair):
+    a, b = pair
+    first, second = sent_frames([{"data": 1}, {"data": 2}])
+    a.sendall(second)
+    with pytest.raises(ProtocolError, match='Expected frame 0, received 1'):
+        PipelinedProtocolManager().receive(b)
+
+
+def test_duplicated_frame_is_detected(pair):
+    a, b = pair
+    first, = sent_frames([{"data": 1}])
+    a.sendall(first + first)
+    receiver = PipelinedProtocolManager()
+    assert receiver.receive(b) == {"data": 1}
+    with pytest.raises(ProtocolError, match='Expected frame 1, received 0'):
+        receiver.receive(b)
+
+
+def test_corrupted_frame_is_detected(pair):
+    a, b = pair
+    frame = bytearray(sent_frames([{"data": 1}])[0])
+    frame[-2] ^= 0xFF
+    a.sendall(bytes(frame))
+    with pytest.raises(ProtocolError, match='Frame 0 is corrupted'):
+        PipelinedProtocolManager().receive(b)
+
+
+def test_ack_of_frame_never_sent_is_detected(pair):
+    a, b = pair
+    payload = b'{"data": 1}'
+    a.sendall(HEADER.pack(len(payload), PipelinedProtocolManager.JSON, 0, 5, zlib.crc32(payload)) + payload)
+    with pytest.raises(ProtocolError, match='Acknowledged frame 5 was never sent'):
+        PipelinedProtocolManager().receive(b)
@@ -0,0 +1,118 @@
+import os
+import signal
+import time
+from multiprocessing import Process, Queue
+
+import pytest
+
+from async_server import AsyncServer
+from columnar_log import ColumnarLog, ColumnarLogUpdater
+from database_updater_simulator import DatabaseUpdaterSimulator
+from protocol import ConfirmationProtocolManager
+from server import Server
+from session import ServerSession
+from transport import parse_address
+
+COLUMNS = sorted(DatabaseUpdaterSimulator.StateSimulator.COLUMNS - Server.CONFIG_STATES)
+
+
+def _serve(queue, server_class, address, updater_class, args, kwargs):
+    os.setpgrp() # stop sends SIGINT to server with all processes created by it, like ctrl+c
+    # no timed commit during test, rows are kept only when manager closes database updater
+    server = server_class(address, None, updater_class(*args, **kwargs), db_update_time=3600)
+    queue.put(server.transport.address)
+    server.start()
+
+
+def start(tmp_path, updater_class, *args, server_class=Server, **kwargs):
+    queue = Queue()
+    p = Process(target=_serve, args=(queue, server_class, 'unix:%s' % (tmp_path / 'server.sock'),
+                                     updater_class, args, kwargs))
+    p.start()
+    return p, queue.get(timeout=30)
+
+
+def stop(p):
+    os.killpg(p.pid, signal.SIGINT)
+    p.join(10)
+
+
+def run_steps(address, steps):
+    protocol = ConfirmationProtocolManager()
+    sock = parse_address(address).connect()
+    try:
+        for t in range(steps):
+            protocol.send(sock, {ServerSession.DATA: {k: float(t) for k in COLUMNS},
+                                 ServerSession.REQUEST: [Server.TIME]})
+            assert protocol.receive(sock)[Server.TIME] == t + 1 # time of step is counted from 1
+    finally:
+        sock.close()
+    time.sleep(0.2) # manager adds row of the last step after client has left it
+
+
+def test_columnar_log_keeps_rows_after_sigint(tmp_path):
+    path = str(tmp_path / 'states.col')
+    p, address = start(tmp_path, ColumnarLogUpdater, '', '', path)
+    try:
+        run_steps(address, 50)
+    finally:
+        stop(p)
+    log = ColumnarLog(path)
+    try:
+        assert log.rows == 50
+    finally:
+        log.close()
+
+
+def test_batched_updater_keeps_rows_after_sigint(tmp_path):
+    pytest.importorskip('sqlalchemy')
+    from sqlalchemy import create_engine, func, select
+    from database_updater import BatchedDatabaseUpdater, State
+
+    path = str(tmp_path / 'states.db')
+    # rows are neither inserted by size of batch nor by time, only when manager closes updater
+    p, address = start(tmp_path, BatchedDatabaseUpdater, '', '', path, dialect='sqlite',
+                       batch_size=1000, flush_time=3600)
+    try:
+        run_steps(address, 50)
+    finally:
+        stop(p)
+    engine = create_engine('sqlite:///%s' % path)
+    try:
+        with engine.connect() as con:
+            assert con.execute(select(func.count()).select_from(State.__table__)).scalar() == 50
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.parametrize('server_class', [Server, AsyncServer])
+def test_invalid_message_is_answered_with_error(tmp_path, server_class):
+    p, address = start(tmp_path, DatabaseUpdaterSimulator, '', '', '', server_class=server_class)
+    protocol = ConfirmationProtocolManager()
+    sock = parse_address(address).connect()
+    try:
+        data = {k: 1.0 for k in COLUMNS}
+        for message in [{ServerSession.DATA: data}, # no request and no session declaring it
+                        {ServerSession.BLOCK: [], ServerSession.REQUEST: [Server.TIME]},
+                        {ServerSession.BLOCK: [data] * (ServerSession.MAX_BLOCK + 1), ServerSession.REQUEST: []}]:
+            protocol.send(sock, message)
+            assert ServerSession.ERROR in protocol.receive(sock)
+        # connection is still served
+        protocol.send(sock, {ServerSession.DATA: data, ServerSession.REQUEST: [Server.TIME]})
+        assert protocol.receive(sock) == {Server.TIME: 1}
+    finally:
+        sock.close()
+        stop(p)
+
+
+def test_protocol_keeps_its_positional_place(tmp_path):
+    protocol = ConfirmationProtocolManager()
+    with pytest.warns(DeprecationWarning):
+        server = Server('unix:%s' % (tmp_path / 'server.sock'), None, DatabaseUpdaterSimulator('', '', ''),
+                        1, 1e-5, protocol)
+    try:
+        assert server.protocol is protocol
+    finally:
+        server.sock.close()
+        server.transport.close()
+        server._manager.shutdown()
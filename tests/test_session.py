@@ -0,0 +1,41 @@
+import array
+import json
+
+import pytest
+
+from arrays import array_variables, to_json
+from session import ClientSession, ServerSession
+
+VARIABLES = ['Fzm', 'profile', 'time']
+ARRAYS = {"profile": ("f", [3])}
+
+
+def wire(message):
+    """Message as received after JSON protocol, arrays arrive as lists"""
+    return json.loads(json.dumps(message, default=to_json))
+
+
+def sessions(codec=None, delta=False):
+    server = ServerSession(VARIABLES, binary=True, arrays=array_variables(ARRAYS))
+    client = ClientSession("c", ["Fzm"], ["profile"], codec=codec, delta=delta)
+    assert client.start(wire(server.handshake(client.handshake(), 0))) is None
+    return server, client
+
+
+@pytest.mark.parametrize('codec', [None, 'schema'])
+@pytest.mark.parametrize('delta', [False, True])
+def test_declared_arrays_are_returned_as_arrays(codec, delta):
+    server, client = sessions(codec, delta)
+    profile = array.array('f', [1, 2, 3])
+    response = server.response({"time": 1, "profile": profile})
+    if not isinstance(response, bytes):
+        response = wire(response)
+    assert client.step_response(response) == {"time": 1, "profile": profile}
+    block = wire(server.block_response([{"time": 2, "profile": profile}]))
+    assert client.block_response(block) == [{"time": 2, "profile": profile}]
+
+
+def test_array_which_is_none_stays_none():
+    _, client = sessions()
+    received = client.step_response({"time": 1, "profile": None, "Fzm": 2.0})
+    assert received == {"time": 1, "profile": None, "Fzm": 2.0}
@@ -0,0 +1,183 @@
+import logging
+import os
+import socket
+import stat
+
+logger = logging.getLogger(__name__)
+
+"""
+Transports used by server and clients, selected by address syntax:
+tcp:host:port (or host and port given separately) - TCP/IP,
+unix:path - unix domain socket, clients running on the same host
+as the server skip loopback TCP/IP stack.
+Server writes address it listens on to endpoint file, so clients
+find it on any free port or socket path.
+"""
+
+ENDPOINT_FILE = 'endpoint.txt'
+
+
+def set_buffers(sock, buffer_size):
+    """
+    Sets send and receive buffers of socket, None keeps system defaults
+    (on Linux explicit size switches off buffer autotuning of TCP)
+    """
+    if buffer_size:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+
+
+class TcpTransport(object):
+    """TCP/IP transport, address tcp:host:port"""
+    SCHEME = 'tcp'
+
+    def __init__(self, host, port, buffer_size=None):
+        """
+        :param host: ip address
+        :param port: tcp port, listen starts searching for free port from it
+        :param buffer_size: socket buffers in bytes, None - system defaults
+        """
+        self.host = host
+        self.port = port
+        self.buffer_size = buffer_size
+
+    @property
+    def address(self):
+        return '%s:%s:%d' % (self.SCHEME, self.host, self.port)
+
+    def configure(self, sock):
+        """
+        Options of connected socket: small messages are exchanged in both directions
+        on persistent connection, Nagle's algorithm would delay them until delayed ack of the peer
+        """
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def listen(self, backlog=128):
+        """
+        Binds the first free port starting from self.port
+        TCP/IP blocks port after closing it, blocking time can last even 4 minutes
+        """
+        while True:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.bind((self.host, self.port))
+                break
+            except Exception as e:
+                sock.close()
+                logger.error(e)
+                self.port += 1
+        logger.info('starting up on %s port %s', self.host, self.port)
+        # accepted connections inherit buffers, receive buffer has to be set before listen
+        set_buffers(sock, self.buffer_size)
+        sock.listen(backlog)
+        return sock
+
+    def connect(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        set_buffers(sock, self.buffer_size)
+        logger.debug('connecting to %s port %s', self.host, self.port)
+        sock.connect((self.host, self.port))
+        self.configure(sock)
+        return sock
+
+    def close(self):
+        pass
+
+
+class UnixTransport(object):
+    """Unix domain socket transport, address unix:path"""
+    SCHEME = 'unix'
+    port = None
+
+    def __init__(self, path, buffer_size=None):
+        """
+        :param path: path of socket file
+        :param buffer_size: socket buffers in bytes, None - system defaults
+        """
+        self.path = path
+        self.buffer_size = buffer_size
+
+    @property
+    def address(self):
+        return '%s:%s' % (self.SCHEME, self.path)
+
+    def configure(self, sock):
+        """Unix sockets have no Nagle's algorithm, nothing to set"""
+        pass
+
+    def _remove_stale(self):
+        """Removes socket file left by server which is not running any more"""
+        if not os.path.exists(self.path):
+            return
+        if not stat.S_ISSOCK(os.stat(self.path).st_mode):
+            raise Exception('%s exists and it is not socket' % self.path)
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except ConnectionRefusedError:
+            os.remove(self.path)
+            return
+        finally:
+            probe.close()
+        raise Exception('Server is already listening on %s' % self.path)
+
+    def listen(self, backlog=128):
+        self._remove_stale()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        logger.info('starting up on %s', self.path)
+        set_buffers(sock, self.buffer_size)
+        sock.listen(backlog)
+        return sock
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        set_buffers(sock, self.buffer_size)
+        logger.debug('connecting to %s', self.path)
+        sock.connect(self.path)
+        return sock
+
+    def close(self):
+        """Removes socket file of listening server"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+TRANSPORTS = {
+    TcpTransport.SCHEME: TcpTransport,
+    UnixTransport.SCHEME: UnixTransport,
+}
+
+
+def parse_address(address, port=None, buffer_size=None):
+    """
+    Creates transport of address
+    :param address: unix:path, tcp:host:port, tcp:host or host
+    :param port: tcp port used when address does not contain it
+    :param buffer_size: socket buffers in bytes, None - system defaults
+    """
+    if address.startswith(UnixTransport.SCHEME + ':'):
+        return UnixTransport(address[len(UnixTransport.SCHEME) + 1:], buffer_size)
+    if address.startswith(TcpTransport.SCHEME + ':'):
+        address = address[len(TcpTransport.SCHEME) + 1:]
+        if ':' in address:
+            address, port = address.rsplit(':', 1)
+    if port is None:
+        raise Exception('Port of %s is missing, available transports: %s' % (address, ', '.join(sorted(TRANSPORTS))))
+    return TcpTransport(address, int(port), buffer_size)
+
+
+def write_endpoint(address, path=ENDPOINT_FILE):
+    """Publishes address of running server"""
+    with open(path, 'w') as f:
+        f.write(address + '\n')
+
+
+def read_endpoint(path=ENDPOINT_FILE):
+    """:return: address written by server, None when endpoint file does not exist"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.readline().strip()